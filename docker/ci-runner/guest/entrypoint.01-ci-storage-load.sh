@@ -11,16 +11,24 @@ echo "$CI_STORAGE_HOST" > ci-storage-host
 local_dir=$WORK_DIR/${GH_REPOSITORY##*/}/${GH_REPOSITORY##*/}
 
 mkdir -p "$local_dir"
+storage_dir="$WORK_DIR/$GH_REPOSITORY/$(realpath "$local_dir" | tr / _)"
 cat <<EOT > ~/.bash_profile
 #!/bin/bash
 cd "$local_dir" 2>/dev/null || true
 EOT
 
+# Created by ci-storage once the priority files (see CI_STORAGE_LOAD_PRIORITY)
+# are loaded; the runner may start at that moment, while the remaining files
+# are still being loaded in background.
+ci_storage_ready_file=~/.ci-storage-load.ready
+
 if [[ "$CI_STORAGE_HOST" != "" && -f ~/.ssh/id_rsa ]]; then
   say "Running the initial \"ci-storage load\" for $local_dir in background..."
   ci-storage load \
     --storage-host="$CI_STORAGE_HOST" \
-    --storage-dir="$WORK_DIR/$GH_REPOSITORY/$(realpath "$local_dir" | tr / _)" \
+    --storage-dir="$storage_dir" \
     --slot-id="*" \
-    --local-dir="$local_dir" &
+    --local-dir="$local_dir" \
+    --priority="$CI_STORAGE_LOAD_PRIORITY" \
+    --ready-file="$ci_storage_ready_file" &
 fi
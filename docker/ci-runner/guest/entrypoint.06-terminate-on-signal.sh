@@ -47,6 +47,9 @@ terminate_on_signal() {
     sleep 15
     say "Retrying till the runner becomes idle and the removal succeeds..."
   done
+
+  # Defined in entrypoint.15-instance-interruption.sh.
+  instance_interruption_wait_flush
 }
 
 trap "terminate_on_signal SIGINT; exit 130" INT
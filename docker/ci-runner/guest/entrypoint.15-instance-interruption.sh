@@ -1,13 +1,59 @@
 #!/bin/bash
 #
 # Sends a graceful shutdown request to self it the instance interruption notice
-# is received.
+# is received. Also, flushes the work directory to the storage host (on a
+# best-effort basis), so the replacement instance could pick it up instead of
+# some older slot.
 #
 # To test interruption manually:
 # https://github.com/aws/amazon-ec2-spot-interrupter
 #
 set -u -e
 
+# AWS gives 2 minutes between the interruption notice and the termination. We
+# leave some room for the graceful shutdown after the flush.
+ci_storage_flush_deadline_sec=70
+ci_storage_flush_pid_file=~/.ci-storage-flush.pid
+
+instance_interruption_flush() {
+  if [[ "$CI_STORAGE_HOST" == "" || ! -f ~/.ssh/id_rsa ]]; then
+    return
+  fi
+  say "Flushing $local_dir to ci-storage before the interruption (deadline: ${ci_storage_flush_deadline_sec}s)..."
+  # Only the changed files are sent (the slot loaded previously is used as
+  # --link-dest), and the slot is either committed atomically before the
+  # deadline or not at all. Hints are taken from the previous "load" action.
+  ci-storage store \
+    --storage-host="$CI_STORAGE_HOST" \
+    --storage-dir="$storage_dir" \
+    --slot-id="interrupted-$(aws_instance_id)" \
+    --local-dir="$local_dir" \
+    --deadline-sec="$ci_storage_flush_deadline_sec" \
+    --urgent \
+    || say "Failed to flush $local_dir to ci-storage, ignoring."
+}
+
+# Called from terminate_on_signal(): the entrypoint is PID 1 of the container,
+# so once it exits, the flush running in background would be killed halfway.
+# The flush is bounded by its own deadline, but we don't trust it blindly.
+instance_interruption_wait_flush() {
+  if [[ ! -f "$ci_storage_flush_pid_file" ]]; then
+    return
+  fi
+  flush_pid=$(cat "$ci_storage_flush_pid_file")
+  count=0
+  while kill -0 "$flush_pid" 2>/dev/null; do
+    if [[ $count == 0 ]]; then
+      say "Waiting for the flush of $local_dir to ci-storage to finish..."
+    elif [[ $count -ge $((ci_storage_flush_deadline_sec + 10)) ]]; then
+      say "The flush of $local_dir to ci-storage is still running, giving up."
+      break
+    fi
+    sleep 1
+    count=$((count + 1))
+  done
+}
+
 instance_interruption_loop() {
   pid="$1"
 
@@ -27,7 +73,10 @@ instance_interruption_loop() {
     )
     if [[ "$response_http_200" != "" ]]; then
       say "Instance interruption detected, sending SIGINT to PID $pid."
+      instance_interruption_flush &
+      echo $! > "$ci_storage_flush_pid_file"
       kill -SIGINT "$pid"
+      wait
       return
     else
       sleep 2
@@ -35,4 +84,5 @@ instance_interruption_loop() {
   done
 }
 
+rm -f "$ci_storage_flush_pid_file"
 instance_interruption_loop $$ &
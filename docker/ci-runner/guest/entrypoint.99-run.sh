@@ -6,11 +6,15 @@
 #
 set -u -e
 
-while :; do
-  say 'Waiting for the initial "ci-storage load" to finish...'
+# Wait until the initial "ci-storage load" signals that the priority files are
+# loaded (or until it exits). The remaining files continue loading in
+# background; job-time "ci-storage" calls wait for it to finish.
+while [[ ! -f "$ci_storage_ready_file" ]]; do
+  say 'Waiting for the initial "ci-storage load" to load the priority files...'
   pgrep -xa ci-storage || break
   for _i in {1..6}; do
     sleep 0.5
+    [[ ! -f "$ci_storage_ready_file" ]] || break
     pgrep -xa ci-storage >/dev/null || break
   done
 done
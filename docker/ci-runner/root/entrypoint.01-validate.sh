@@ -46,6 +46,9 @@ if [[ "${CI_STORAGE_HOST:=}" != "" && ! "$CI_STORAGE_HOST" =~ ^([-.[:alnum:]]+@)
   exit 1
 fi
 
+export CI_STORAGE_LOAD_PRIORITY
+: "${CI_STORAGE_LOAD_PRIORITY:=}"
+
 export BTIME
 if [[ "${BTIME:=}" != "" && ! "$BTIME" =~ ^[0-9]+$ ]]; then
   say "If BTIME is passed, it must be a number (boot timestamp)."
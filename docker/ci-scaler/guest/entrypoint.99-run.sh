@@ -8,7 +8,8 @@ if [[ "$ASGS" != "" ]]; then
   exec python3 ./scaler/main.py \
     --asgs="$ASGS" \
     --domain="$DOMAIN" \
-    --dynamodb-table-prefix="$DYNAMODB_TABLE_PREFIX"
+    --dynamodb-table-prefix="$DYNAMODB_TABLE_PREFIX" \
+    --runners-org="$RUNNERS_ORG"
 else
   exec sleep 1000000000
 fi
@@ -1,29 +1,97 @@
 import dataclasses
+import datetime
 import functools
+import hashlib
+import hmac
+import http.client
 import json
 import os
+import random
 import re
-import subprocess
+import threading
+import time
 import urllib.error
+import urllib.parse
 import urllib.request
-from helpers import check_output
+import xml.etree.ElementTree as ET
+from helpers import AsgDescription, CalledProcessError, HttpConnectionPool
 from typing import Any, Literal
 
 
 NAMESPACE = "ci-storage/metrics"
 METADATA_TIMEOUT_SEC = 3
 DRY_RUN_MSG = "(DRY-RUN: no AWS metadata service)"
+API_TIMEOUT_SEC = 30
+API_POOL_SIZE = 8
+API_RETRY_ATTEMPTS = 4
+API_RETRY_BACKOFF_SEC = 0.2
+DESCRIBE_ASGS_MAX_RECORDS = 100
+CREDENTIALS_REFRESH_BEFORE_SEC = 300
+QUERY_API_VERSIONS = {
+    "autoscaling": "2011-01-01",
+    "monitoring": "2010-08-01",
+}
+RETRYABLE_ERROR_CODES = {
+    "InternalFailure",
+    "InternalServerError",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
 
 
 @dataclasses.dataclass
-class AsgDescription:
-    desired_capacity: int
-    min_size: int
-    max_size: int
-    instance_ids: list[str]
+class MetricDatum:
+    name: str
+    dimensions: dict[str, str]
+    timestamp: float
+    count: int
+    sum: float
+    min: float
+    max: float
+
+
+@dataclasses.dataclass
+class AwsCredentials:
+    access_key_id: str
+    secret_access_key: str
+    session_token: str | None = None
+    expires_at: float | None = None
+
+
+#
+# Raised when an AWS API responds with an error. It mimics the error of a
+# failed "aws" CLI command (with the same "An error occurred (Code) when
+# calling the Action operation: Message" text in stderr), so the callers
+# written for the CLI handle it the same way.
+#
+class AwsError(CalledProcessError):
+    def __init__(
+        self,
+        *,
+        service: str,
+        action: str,
+        status: int,
+        code: str,
+        message: str,
+    ):
+        super().__init__(
+            254,
+            ["aws", service, action],
+            "",
+            f"An error occurred ({code}) when calling the {action} operation: {message}",
+        )
+        self.status = status
+        self.code = code
+
+
+_credentials: AwsCredentials | None = None
+_credentials_lock = threading.Lock()
 
 
-@functools.lru_cache(maxsize=None)
 def aws_metadata_curl(path: str) -> str | None:
     try:
         with urllib.request.urlopen(
@@ -59,96 +127,319 @@ def aws_region() -> str | None:
     return re.sub(r"[a-z]$", "", az) if az else None
 
 
-def aws(
-    *args: str,
-    input: str | None = None,
-) -> str | None:
+def aws_credentials() -> AwsCredentials:
+    global _credentials
+    access_key_id = os.environ.get("AWS_ACCESS_KEY_ID")
+    secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+    if access_key_id and secret_access_key:
+        return AwsCredentials(
+            access_key_id=access_key_id,
+            secret_access_key=secret_access_key,
+            session_token=os.environ.get("AWS_SESSION_TOKEN") or None,
+        )
+    with _credentials_lock:
+        if _credentials and (
+            _credentials.expires_at is None
+            or _credentials.expires_at - CREDENTIALS_REFRESH_BEFORE_SEC > time.time()
+        ):
+            return _credentials
+        path = "latest/meta-data/iam/security-credentials/"
+        role = (aws_metadata_curl(path) or "").strip().split("\n")[0]
+        res = json.loads(aws_metadata_curl(path + role) or "{}") if role else {}
+        if "AccessKeyId" not in res:
+            raise ValueError("Unable to locate AWS credentials")
+        _credentials = AwsCredentials(
+            access_key_id=res["AccessKeyId"],
+            secret_access_key=res["SecretAccessKey"],
+            session_token=res.get("Token"),
+            expires_at=datetime.datetime.strptime(
+                res["Expiration"], "%Y-%m-%dT%H:%M:%SZ"
+            )
+            .replace(tzinfo=datetime.timezone.utc)
+            .timestamp(),
+        )
+        return _credentials
+
+
+def aws_sigv4_sign(
+    *,
+    method: str,
+    url: str,
+    headers: dict[str, str],
+    body: bytes,
+    region: str,
+    service: str,
+    credentials: AwsCredentials,
+    now: datetime.datetime,
+) -> dict[str, str]:
+    parsed = urllib.parse.urlsplit(url)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    scope = f"{now.strftime('%Y%m%d')}/{region}/{service}/aws4_request"
+    headers = {
+        **headers,
+        "Host": parsed.netloc,
+        "X-Amz-Date": amz_date,
+        **(
+            {"X-Amz-Security-Token": credentials.session_token}
+            if credentials.session_token
+            else {}
+        ),
+    }
+    canonical_headers = sorted(
+        (name.lower(), " ".join(value.split())) for name, value in headers.items()
+    )
+    signed_headers = ";".join(name for name, _ in canonical_headers)
+    canonical_request = "\n".join(
+        [
+            method,
+            urllib.parse.quote(parsed.path or "/", safe="/-_.~"),
+            "&".join(
+                f"{urllib.parse.quote(k, safe='-_.~')}={urllib.parse.quote(v, safe='-_.~')}"
+                for k, v in sorted(
+                    urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+                )
+            ),
+            "".join(f"{name}:{value}\n" for name, value in canonical_headers),
+            signed_headers,
+            hashlib.sha256(body).hexdigest(),
+        ]
+    )
+    string_to_sign = "\n".join(
+        [
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ]
+    )
+    key = f"AWS4{credentials.secret_access_key}".encode()
+    for part in scope.split("/"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={credentials.access_key_id}/{scope}, "
+        + f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return headers
+
+
+@functools.lru_cache(maxsize=None)
+def aws_pool(url: str) -> HttpConnectionPool:
+    return HttpConnectionPool(url=url, size=API_POOL_SIZE, timeout=API_TIMEOUT_SEC)
+
+
+def aws_request(
+    *,
+    service: str,
+    action: str,
+    content_type: str,
+    headers: dict[str, str],
+    body: bytes,
+) -> bytes | None:
     region = aws_region()
     endpoint_url = os.environ.get("AWS_ENDPOINT_URL")
-    if args[0] == "dynamodb" and endpoint_url:
+    if service == "dynamodb" and endpoint_url:
         region = "us-east-1"
     if not region:
         return None
-    cmd = [
-        "aws",
-        f"--region={region}",
-        *([f"--endpoint-url={endpoint_url}"] if endpoint_url else ()),
-        *args,
-    ]
-    out = check_output(cmd, input=input)
-    return out
-
-
-def aws_json(
-    *args: str,
-    input: str | None = None,
+    url = endpoint_url or f"https://{service}.{region}.amazonaws.com"
+    pool = aws_pool(url)
+    path = urllib.parse.urlsplit(url).path or "/"
+    for attempt in range(1, API_RETRY_ATTEMPTS + 1):
+        signed_headers = aws_sigv4_sign(
+            method="POST",
+            url=url,
+            headers={**headers, "Content-Type": content_type},
+            body=body,
+            region=region,
+            service=service,
+            credentials=aws_credentials(),
+            now=datetime.datetime.now(datetime.timezone.utc),
+        )
+        try:
+            status, _, data = pool.request(
+                "POST",
+                path,
+                body=body,
+                headers=signed_headers,
+            )
+        except (OSError, http.client.HTTPException):
+            if attempt >= API_RETRY_ATTEMPTS:
+                raise
+        else:
+            if status < 400:
+                return data
+            code, message = aws_parse_error(data)
+            if attempt >= API_RETRY_ATTEMPTS or (
+                status < 500 and code not in RETRYABLE_ERROR_CODES
+            ):
+                raise AwsError(
+                    service=service,
+                    action=action,
+                    status=status,
+                    code=code,
+                    message=message,
+                )
+        # Throttled, or a transient network/server error: back off with jitter.
+        time.sleep(API_RETRY_BACKOFF_SEC * 2 ** (attempt - 1) * random.uniform(1, 2))
+    raise AssertionError("unreachable")
+
+
+def aws_parse_error(data: bytes) -> tuple[str, str]:
+    text = data.decode(errors="replace")
+    try:
+        res = json.loads(text)
+        code = str(res.get("__type", "Unknown")).split("#")[-1]
+        return code, str(res.get("message", res.get("Message", "")))
+    except ValueError:
+        pass
+    try:
+        root = aws_parse_xml(data)
+        return (
+            root.findtext(".//Error/Code") or "Unknown",
+            root.findtext(".//Error/Message") or "",
+        )
+    except ET.ParseError:
+        return "Unknown", text.strip()
+
+
+def aws_parse_xml(data: bytes) -> ET.Element:
+    root = ET.fromstring(data)
+    for el in root.iter():
+        el.tag = el.tag.split("}")[-1]
+    return root
+
+
+def aws_dynamodb(
+    action: str,
+    params: dict[str, Any],
 ) -> dict[str, Any] | None:
-    res = aws(*args, "--output=json", input=input)
-    return json.loads(res.strip()) if res else None
+    res = aws_request(
+        service="dynamodb",
+        action=action,
+        content_type="application/x-amz-json-1.0",
+        headers={"X-Amz-Target": f"DynamoDB_20120810.{action}"},
+        body=json.dumps(params).encode(),
+    )
+    return json.loads(res or b"{}") if res is not None else None
+
+
+def aws_query(
+    service: str,
+    action: str,
+    params: dict[str, str],
+) -> ET.Element | None:
+    res = aws_request(
+        service=service,
+        action=action,
+        content_type="application/x-www-form-urlencoded; charset=utf-8",
+        headers={},
+        body=urllib.parse.urlencode(
+            {"Action": action, "Version": QUERY_API_VERSIONS[service], **params}
+        ).encode(),
+    )
+    return aws_parse_xml(res) if res is not None else None
 
 
 def aws_cloudwatch_put_metric_data(
     *,
-    metrics: dict[str, int],
-    dimensions: dict[str, str],
+    data: list[MetricDatum],
 ) -> Literal[True] | None:
-    res = aws(
-        "cloudwatch",
-        "put-metric-data",
-        f"--namespace={NAMESPACE}",
-        "--metric-data",
-        *(
-            f"MetricName={name},Value={value},Unit=None,StorageResolution=1,Dimensions=["
-            + ",".join(
-                f"{{Name={name},Value={value}}}" for name, value in dimensions.items()
-            )
-            + "]"
-            for name, value in metrics.items()
-        ),
-    )
+    params = {"Namespace": NAMESPACE}
+    for i, datum in enumerate(data, 1):
+        prefix = f"MetricData.member.{i}"
+        params[f"{prefix}.MetricName"] = datum.name
+        params[f"{prefix}.Timestamp"] = datetime.datetime.fromtimestamp(
+            datum.timestamp, datetime.timezone.utc
+        ).strftime("%Y-%m-%dT%H:%M:%SZ")
+        params[f"{prefix}.StatisticValues.SampleCount"] = str(datum.count)
+        params[f"{prefix}.StatisticValues.Sum"] = str(datum.sum)
+        params[f"{prefix}.StatisticValues.Minimum"] = str(datum.min)
+        params[f"{prefix}.StatisticValues.Maximum"] = str(datum.max)
+        params[f"{prefix}.Unit"] = "None"
+        params[f"{prefix}.StorageResolution"] = "60"
+        for j, (dim_name, dim_value) in enumerate(datum.dimensions.items(), 1):
+            params[f"{prefix}.Dimensions.member.{j}.Name"] = dim_name
+            params[f"{prefix}.Dimensions.member.{j}.Value"] = dim_value
+    res = aws_query("monitoring", "PutMetricData", params)
     return None if res is None else True
 
 
+def aws_autoscaling_describe_auto_scaling_groups(
+    *,
+    asg_names: list[str],
+) -> dict[str, AsgDescription] | None:
+    descriptions: dict[str, AsgDescription] = {}
+    for i in range(0, len(asg_names), DESCRIBE_ASGS_MAX_RECORDS):
+        params = {
+            f"AutoScalingGroupNames.member.{n}": asg_name
+            for n, asg_name in enumerate(
+                asg_names[i : i + DESCRIBE_ASGS_MAX_RECORDS], 1
+            )
+        }
+        params["MaxRecords"] = str(DESCRIBE_ASGS_MAX_RECORDS)
+        next_token: str | None = None
+        while True:
+            res = aws_query(
+                "autoscaling",
+                "DescribeAutoScalingGroups",
+                {**params, **({"NextToken": next_token} if next_token else {})},
+            )
+            if res is None:
+                return None
+            for asg in res.findall(".//AutoScalingGroups/member"):
+                descriptions[asg.findtext("AutoScalingGroupName", "")] = (
+                    AsgDescription(
+                        desired_capacity=int(asg.findtext("DesiredCapacity", "0")),
+                        min_size=int(asg.findtext("MinSize", "0")),
+                        max_size=int(asg.findtext("MaxSize", "0")),
+                        instance_ids=[
+                            instance.findtext("InstanceId", "")
+                            for instance in asg.findall("Instances/member")
+                        ],
+                    )
+                )
+            next_token = res.findtext(".//NextToken")
+            if not next_token:
+                break
+    return descriptions
+
+
 def aws_autoscaling_describe_auto_scaling_group(
     *,
     asg_name: str,
 ) -> AsgDescription | None:
-    res = aws_json(
-        "autoscaling",
-        "describe-auto-scaling-groups",
-        f"--auto-scaling-group-names={asg_name}",
-    )
+    res = aws_autoscaling_describe_auto_scaling_groups(asg_names=[asg_name])
     if res is None:
         return None
-    asgs = res.get("AutoScalingGroups")
-    if not asgs:
+    if asg_name not in res:
         raise ValueError(f"AutoScalingGroup {asg_name} not found")
-    asg = asgs[0]
-    return AsgDescription(
-        desired_capacity=asg["DesiredCapacity"],
-        min_size=asg["MinSize"],
-        max_size=asg["MaxSize"],
-        instance_ids=[instance["InstanceId"] for instance in asg["Instances"]],
-    )
+    return res[asg_name]
 
 
 def aws_autoscaling_increment_desired_capacity(
     *,
     asg_name: str,
     inc: int,
-) -> Literal[True] | None:
+) -> int | None:
     desc = aws_autoscaling_describe_auto_scaling_group(asg_name=asg_name)
     if desc is None:
         return None
+    desired_capacity = min(
+        max(desc.desired_capacity + inc, desc.min_size),
+        desc.max_size,
+    )
     try:
-        aws(
+        aws_query(
             "autoscaling",
-            "set-desired-capacity",
-            f"--auto-scaling-group-name={asg_name}",
-            f"--desired-capacity={min(max(desc.desired_capacity + inc, desc.min_size), desc.max_size)}",
+            "SetDesiredCapacity",
+            {
+                "AutoScalingGroupName": asg_name,
+                "DesiredCapacity": str(desired_capacity),
+            },
         )
-        return True
-    except subprocess.CalledProcessError as e:
+        return desired_capacity
+    except AwsError as e:
         if "above" in e.stderr:
             # "An error occurred (ValidationError) when calling the
             # SetDesiredCapacity operation: New SetDesiredCapacity value N is
@@ -156,13 +447,15 @@ def aws_autoscaling_increment_desired_capacity(
             # there is a race condition (better than nothing).
             desc = aws_autoscaling_describe_auto_scaling_group(asg_name=asg_name)
             assert desc is not None
-            aws(
+            aws_query(
                 "autoscaling",
-                "set-desired-capacity",
-                f"--auto-scaling-group-name={asg_name}",
-                f"--desired-capacity={desc.max_size}",
+                "SetDesiredCapacity",
+                {
+                    "AutoScalingGroupName": asg_name,
+                    "DesiredCapacity": str(desc.max_size),
+                },
             )
-            return True
+            return desc.max_size
         else:
             raise
 
@@ -172,25 +465,23 @@ def aws_autoscaling_terminate_instance(
     instance_id: str,
 ) -> Literal[True] | None:
     try:
-        res = aws(
+        res = aws_query(
             "autoscaling",
-            "terminate-instance-in-auto-scaling-group",
-            f"--instance-id={instance_id}",
-            "--should-decrement-desired-capacity",
+            "TerminateInstanceInAutoScalingGroup",
+            {"InstanceId": instance_id, "ShouldDecrementDesiredCapacity": "true"},
         )
         return None if res is None else True
-    except subprocess.CalledProcessError as e:
+    except AwsError as e:
         if "shouldDecrementDesiredCapacity" in e.stderr:
             # E.g. this error message: "Currently, desiredSize equals minSize
             # (3). Terminating instance without replacement will violate group's
             # min size constraint. Either set shouldDecrementDesiredCapacity
             # flag to false or lower group's min size." - do a retry without
             # decrementing desired capacity.
-            res = aws(
+            res = aws_query(
                 "autoscaling",
-                "terminate-instance-in-auto-scaling-group",
-                f"--instance-id={instance_id}",
-                "--no-should-decrement-desired-capacity",
+                "TerminateInstanceInAutoScalingGroup",
+                {"InstanceId": instance_id, "ShouldDecrementDesiredCapacity": "false"},
             )
             return None if res is None else True
         elif "not found" in e.stderr:
@@ -1,16 +1,121 @@
 import codecs
+import functools
 import hashlib
+import http.client
 import json
 import os
 import random
-import shlex
-import subprocess
+import re
 import time
 import traceback
+import urllib.parse
 import yaml
-from helpers import Runner, RateLimits, check_output
+from helpers import (
+    CalledProcessError,
+    HttpConnectionPool,
+    Runner,
+    RateLimits,
+    check_output,
+)
+from storage import MemoryDict
 from typing import Any, Literal, cast
 
+API_URL = os.environ.get("GITHUB_API_URL") or "https://api.github.com"
+API_TIMEOUT_SEC = 30
+API_POOL_SIZE = 8
+RUNNER_GROUP_REPOSITORIES_TTL_SEC = 600
+
+_runner_group_repositories = MemoryDict[set[str]](
+    ttl=RUNNER_GROUP_REPOSITORIES_TTL_SEC
+)
+
+
+#
+# Raised when GitHub API responds with an error status. It mimics the error of
+# a failed "gh api" command (with the response body in stdout), so the callers
+# written for the gh CLI handle it the same way.
+#
+class GhApiError(CalledProcessError):
+    def __init__(self, *, method: str, path: str, status: int, body: str):
+        try:
+            message = str(json.loads(body).get("message", ""))
+        except Exception:
+            message = ""
+        super().__init__(
+            1,
+            ["gh", "api", f"-X{method}", path],
+            body,
+            f"gh: {message or http.client.responses.get(status, 'Error')} (HTTP {status})",
+        )
+        self.status = status
+
+
+#
+# A response of GitHub API.
+#
+class GhApiResponse:
+    def __init__(self, *, status: int, headers: http.client.HTTPMessage, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        text = self.body.decode().strip()
+        return json.loads(text) if text else None
+
+    def next_path(self) -> str | None:
+        match = re.search(r'<([^>]+)>;\s*rel="next"', self.headers.get("Link", ""))
+        return match.group(1) if match else None
+
+
+#
+# An in-process GitHub API client. Talks to the API over a pool of keep-alive
+# HTTPS connections, so each call costs neither a gh process spawn nor a TLS
+# handshake. It's safe to use from multiple threads.
+#
+class GhApiClient:
+    def __init__(self, *, url: str, token: str, pool_size: int):
+        self.base_path = urllib.parse.urlsplit(url).path.rstrip("/")
+        self.token = token
+        self.pool = HttpConnectionPool(
+            url=url,
+            size=pool_size,
+            timeout=API_TIMEOUT_SEC,
+        )
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        input: Any | None = None,
+    ) -> GhApiResponse:
+        if path.startswith("https://"):
+            parsed = urllib.parse.urlsplit(path)
+            path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        else:
+            path = self.base_path + "/" + path.lstrip("/")
+        body = json.dumps(input).encode() if input is not None else None
+        status, headers, data = self.pool.request(
+            method,
+            path,
+            body=body,
+            headers={
+                "Accept": "application/vnd.github.v3+json",
+                "Authorization": f"Bearer {self.token}",
+                "User-Agent": "ci-scaler",
+                **({"Content-Type": "application/json"} if body is not None else {}),
+            },
+        )
+        if status >= 400:
+            raise GhApiError(
+                method=method,
+                path=path,
+                status=status,
+                body=data.decode(errors="replace"),
+            )
+        return GhApiResponse(status=status, headers=headers, body=data)
+
 
 def gh(
     *args: str,
@@ -19,76 +124,145 @@ def gh(
     return check_output(["gh", *args], input=input)
 
 
-def gh_api(
-    *args: str,
+@functools.lru_cache(maxsize=None)
+def gh_auth_token() -> str:
+    # In Ubuntu, gh tool may be old, so it may not support "gh auth token". So
+    # we try to use a well-known environment variable first.
+    token = os.environ.get("GH_TOKEN", os.environ.get("GITHUB_TOKEN"))
+    if not token:
+        token = gh("auth", "token")
+    return token
+
+
+def gh_token() -> str:
+    return gh_auth_token().strip()
+
+
+@functools.lru_cache(maxsize=None)
+def gh_client() -> GhApiClient:
+    return GhApiClient(url=API_URL, token=gh_token(), pool_size=API_POOL_SIZE)
+
+
+def gh_request(
+    method: str,
+    path: str,
+    *,
     input: Any | None = None,
-) -> Any:
-    args = (
-        "api",
-        *(["--input=-"] if input else []),
-        "-H",
-        "Accept: application/vnd.github.v3+json",
-        *args,
-    )
-    res = None
+) -> GhApiResponse:
     try:
-        res = gh(
-            *args,
-            input=json.dumps(input) if input is not None else None,
-        ).strip()
-        return json.loads(res) if res else None
-    except Exception:
+        return gh_client().request(method, path, input=input)
+    except Exception as e:
         with open(f"/tmp/gh_api_error.{random.randint(0, 9)}.txt", "w") as f:
-            f.write(f"$ gh {shlex.join(args).strip()}\n")
+            f.write(f"$ {method} {path}\n")
             f.write(f"{traceback.format_exc().rstrip()}\n")
-            f.write(f"{res}\n")
+            f.write(f"{e.stdout if isinstance(e, GhApiError) else None}\n")
         raise
 
 
+def gh_api(
+    path: str,
+    *,
+    method: str = "GET",
+    input: Any | None = None,
+) -> Any:
+    return gh_request(method, path, input=input).json()
+
+
+def gh_api_pages(path: str) -> list[Any]:
+    pages: list[Any] = []
+    next_path: str | None = path
+    while next_path:
+        res = gh_request("GET", next_path)
+        pages.append(res.json())
+        next_path = res.next_path()
+    return pages
+
+
 def gh_fetch_runners(
     *,
     repository: str,
 ) -> list[Runner]:
-    res = gh_api(
-        f"repos/{repository}/actions/runners?per_page=100",
-        "--paginate",
-        "--slurp",
-    )
+    res = gh_api_pages(f"repos/{repository}/actions/runners?per_page=100")
     if not isinstance(res, list) or not res:
         raise ValueError(f"gh api returned a non-list of pages: {res}")
     return [
-        Runner(
-            id=str(runner["id"]),
-            name=str(runner["name"]),
-            status=runner["status"],
-            busy=bool(runner["busy"]),
-            labels=[
-                str(item["name"])
-                for item in runner["labels"]
-                if item["type"] == "custom"
-            ],
-            loaded_at=int(time.time()),
-        )
+        gh_parse_runner(runner, org=None)
         for page in cast(list[dict[str, Any]], res)
         for runner in cast(list[dict[str, Any]], page["runners"])
     ]
 
 
+def gh_fetch_org_runners(
+    *,
+    org: str,
+) -> list[tuple[Runner, set[str] | None]]:
+    # The list of organization runners doesn't tell, which runner group each
+    # runner belongs to, and the group defines the repositories which can use
+    # the runner. So we list runners group by group (there are usually just a
+    # few of them, comparing to the repositories).
+    res: list[tuple[Runner, set[str] | None]] = []
+    for groups_page in gh_api_pages(f"orgs/{org}/actions/runner-groups?per_page=100"):
+        for group in cast(list[dict[str, Any]], groups_page["runner_groups"]):
+            group_id = str(group["id"])
+            repositories = (
+                gh_fetch_runner_group_repositories(org=org, group_id=group_id)
+                if group["visibility"] == "selected"
+                else None
+            )
+            for page in gh_api_pages(
+                f"orgs/{org}/actions/runner-groups/{group_id}/runners?per_page=100"
+            ):
+                for runner in cast(list[dict[str, Any]], page["runners"]):
+                    res.append((gh_parse_runner(runner, org=org), repositories))
+    return res
+
+
+def gh_fetch_runner_group_repositories(*, org: str, group_id: str) -> set[str]:
+    cache_key = f"{org}:{group_id}"
+    repositories = _runner_group_repositories.get(cache_key)
+    if repositories is None:
+        repositories = set(
+            str(repository["full_name"]).lower()
+            for page in gh_api_pages(
+                f"orgs/{org}/actions/runner-groups/{group_id}/repositories?per_page=100"
+            )
+            for repository in cast(list[dict[str, Any]], page["repositories"])
+        )
+        _runner_group_repositories[cache_key] = repositories
+    return repositories
+
+
+def gh_parse_runner(runner: dict[str, Any], *, org: str | None) -> Runner:
+    return Runner(
+        id=str(runner["id"]),
+        name=str(runner["name"]),
+        status=runner["status"],
+        busy=bool(runner["busy"]),
+        labels=[
+            str(item["name"]) for item in runner["labels"] if item["type"] == "custom"
+        ],
+        loaded_at=int(time.time()),
+        org=org,
+    )
+
+
 def gh_runner_ensure_absent(
     *,
     repository: str,
     runner_id: str,
+    org: str | None = None,
 ):
     # It does not fail if id is not found: instead, always returns 204.
-    gh_api("-XDELETE", f"/repos/{repository}/actions/runners/{runner_id}")
+    if org:
+        gh_api(f"/orgs/{org}/actions/runners/{runner_id}", method="DELETE")
+    else:
+        gh_api(f"/repos/{repository}/actions/runners/{runner_id}", method="DELETE")
 
 
 def gh_get_webhook_secret() -> str | None:
-    # In Ubuntu, gh tool may be old, so it may not support "gh auth token". So
-    # we try to use a well-known environment variable first.
-    token = os.environ.get("GH_TOKEN", os.environ.get("GITHUB_TOKEN"))
-    if not token:
-        token = gh("auth", "token")
+    # Derived from the token as "gh auth token" prints it (with the trailing
+    # newline), so the secrets of the already existing webhooks still match.
+    token = gh_auth_token()
     return hashlib.sha256(token.encode()).digest().hex() if token else None
 
 
@@ -101,8 +275,8 @@ def gh_webhook_ensure_exists(
 ) -> Literal["created", "already_exists"]:
     try:
         gh_api(
-            "-XPOST",
             f"/repos/{repository}/hooks",
+            method="POST",
             input={
                 "config": {
                     "url": url,
@@ -114,7 +288,7 @@ def gh_webhook_ensure_exists(
             },
         )
         return "created"
-    except subprocess.CalledProcessError as e:
+    except GhApiError as e:
         if "Hook already exists" in e.stdout:
             return "already_exists"
         raise
@@ -127,22 +301,23 @@ def gh_webhook_ensure_absent(
 ):
     id = gh_webhook_get_id(repository=repository, url=url)
     if id:
-        gh_api("-XDELETE", f"/repos/{repository}/hooks/{id}")
+        gh_api(f"/repos/{repository}/hooks/{id}", method="DELETE")
 
 
 def gh_webhook_get_id(*, repository: str, url: str) -> str | None:
-    ids: list[str] = gh_api(
-        f"/repos/{repository}/hooks",
-        "--jq",
-        f"[.[] | select(.config.url=={json.dumps(url)}) | .id]",
-    )
+    ids = [
+        str(hook["id"])
+        for page in gh_api_pages(f"/repos/{repository}/hooks?per_page=100")
+        for hook in cast(list[dict[str, Any]], page)
+        if hook.get("config", {}).get("url") == url
+    ]
     return ids[0] if ids else None
 
 
 def gh_webhook_ping(*, repository: str, url: str):
     id = gh_webhook_get_id(repository=repository, url=url)
     if id:
-        gh_api("-XPOST", f"/repos/{repository}/hooks/{id}/pings")
+        gh_api(f"/repos/{repository}/hooks/{id}/pings", method="POST")
 
 
 def gh_fetch_workflow(
@@ -168,16 +343,11 @@ def gh_fetch_workflow(
 
 
 def gh_fetch_rate_limits() -> RateLimits:
-    res = gh("api", "-i", "-XHEAD", "/rate_limit")
-    rate_limit = RateLimits(limit=0, remaining=0)
-    for line in res.splitlines():
-        if ":" in line:
-            name, value = [v.strip() for v in line.split(":", 1)]
-            if name.lower() == "x-ratelimit-limit":
-                rate_limit.limit = int(value)
-            elif name.lower() == "x-ratelimit-remaining":
-                rate_limit.remaining = int(value)
-    return rate_limit
+    res = gh_request("HEAD", "/rate_limit")
+    return RateLimits(
+        limit=int(res.headers.get("x-ratelimit-limit", "0")),
+        remaining=int(res.headers.get("x-ratelimit-remaining", "0")),
+    )
 
 
 def gh_predict_workflow_labels(
@@ -1,12 +1,13 @@
 from api_gh import gh_fetch_rate_limits
 from api_docker_hub import docker_hub_fetch_rate_limits
-from api_aws import DRY_RUN_MSG, aws_cloudwatch_put_metric_data
+from api_aws import DRY_RUN_MSG
 from helpers import log
+from metrics import MetricsBuffer
 
 
 class HandlerCloudWatchRateLimits:
-    def __init__(self):
-        pass
+    def __init__(self, *, metrics: MetricsBuffer):
+        self.metrics = metrics
 
     def __str__(self) -> str:
         return self.__class__.__name__
@@ -20,7 +21,7 @@ class HandlerCloudWatchRateLimits:
             "DockerHubLimit": docker_hub.limit,
             "DockerHubRemaining": docker_hub.remaining,
         }
-        has_aws = aws_cloudwatch_put_metric_data(
+        has_aws = self.metrics.add(
             metrics=metrics,
             dimensions={},
         )
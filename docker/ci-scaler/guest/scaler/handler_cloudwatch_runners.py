@@ -1,14 +1,19 @@
 import re
-from api_aws import (
-    DRY_RUN_MSG,
-    aws_autoscaling_describe_auto_scaling_group,
-    aws_cloudwatch_put_metric_data,
-)
-from helpers import AsgHandler, Runner, log
+from api_aws import DRY_RUN_MSG
+from helpers import AsgDescription, AsgHandler, AsgSpec, Runner, log
+from metrics import MetricsBuffer
 
 
 class HandlerCloudWatchRunners(AsgHandler):
-    def handle(self, runners: list[Runner]) -> None:
+    def __init__(self, *, asg_spec: AsgSpec, metrics: MetricsBuffer):
+        super().__init__(asg_spec=asg_spec)
+        self.metrics = metrics
+
+    def handle(
+        self,
+        runners: list[Runner],
+        asg_description: AsgDescription | None,
+    ) -> None:
         metrics: dict[str, int] = {}
         metrics["IdleRunnersCount"] = len(
             [r for r in runners if not r.busy and r.status == "online"]
@@ -31,15 +36,12 @@ class HandlerCloudWatchRunners(AsgHandler):
             )
         )
 
-        asg_description = aws_autoscaling_describe_auto_scaling_group(
-            asg_name=self.asg_spec.asg_name
-        )
         if asg_description:
             metrics["AsgDesiredCapacity"] = asg_description.desired_capacity
             metrics["AsgMinSize"] = asg_description.min_size
             metrics["AsgMaxSize"] = asg_description.max_size
 
-        has_aws = aws_cloudwatch_put_metric_data(
+        has_aws = self.metrics.add(
             metrics=metrics,
             dimensions={
                 "GH_REPOSITORY": self.asg_spec.repository,
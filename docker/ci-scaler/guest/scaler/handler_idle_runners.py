@@ -2,12 +2,12 @@ import time
 import datetime
 from api_aws import (
     DRY_RUN_MSG,
-    aws_autoscaling_describe_auto_scaling_group,
     aws_autoscaling_terminate_instance,
     aws_region,
 )
 from api_gh import gh_runner_ensure_absent
 from helpers import (
+    AsgDescription,
     AsgHandler,
     AsgSpec,
     Runner,
@@ -30,31 +30,38 @@ class HandlerIdleRunners(AsgHandler):
         super().__init__(asg_spec=asg_spec)
         self.max_idle_age_sec = max_idle_age_sec
         self.idle_runners = RunnersRegistry()
+        # Other instances may terminate the same ASG's instances, so never
+        # trust a locally cached answer here.
         self.terminated_instance_ids = storage.create(
             bool,
             ttl=REVISIT_TERMINATED_INSTANCE_SEC,
             name="terminated-instance-ids",
+            cache_ttl=0,
         )
 
-    def handle(self, runners: list[Runner]) -> None:
+    def handle(
+        self,
+        runners: list[Runner],
+        asg_description: AsgDescription | None,
+    ) -> None:
         self.idle_runners.assign_if_not_exists(
             runner
             for runner in runners
             if not runner.busy and runner.status == "online"
         )
+        terminated_instance_ids = self.terminated_instance_ids.get_many(
+            runner.id for runner in self.idle_runners.values()
+        )
         old_idle_runners = sorted(
             [
                 runner
                 for runner in self.idle_runners.values()
-                if runner.id not in self.terminated_instance_ids
+                if runner.id not in terminated_instance_ids
                 and time.time() > runner.loaded_at + self.max_idle_age_sec
             ],
             key=lambda runner: -runner.loaded_at,  # oldest runners last
         )
 
-        asg_description = aws_autoscaling_describe_auto_scaling_group(
-            asg_name=self.asg_spec.asg_name
-        )
         min_size = asg_description.min_size if asg_description else 1
 
         for runner in old_idle_runners[min_size:]:
@@ -77,6 +84,7 @@ class HandlerIdleRunners(AsgHandler):
                     gh_runner_ensure_absent(
                         repository=self.asg_spec.repository,
                         runner_id=runner.id,
+                        org=runner.org,
                     )
                     self.terminated_instance_ids[runner.id] = True
             else:
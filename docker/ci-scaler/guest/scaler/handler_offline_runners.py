@@ -1,15 +1,28 @@
 import time
 from api_gh import gh_runner_ensure_absent
-from helpers import AsgHandler, AsgSpec, Runner, RunnersRegistry, logged_result
+from helpers import (
+    AsgDescription,
+    AsgHandler,
+    AsgSpec,
+    Runner,
+    RunnersRegistry,
+    logged_result,
+)
 
 
 class HandlerOfflineRunners(AsgHandler):
+    requires_asg_description = False
+
     def __init__(self, *, asg_spec: AsgSpec, max_offline_age_sec: int):
         super().__init__(asg_spec=asg_spec)
         self.max_offline_age_sec = max_offline_age_sec
         self.offline_runners = RunnersRegistry()
 
-    def handle(self, runners: list[Runner]) -> None:
+    def handle(
+        self,
+        runners: list[Runner],
+        asg_description: AsgDescription | None,
+    ) -> None:
         self.offline_runners.assign_if_not_exists(
             runner for runner in runners if runner.status == "offline"
         )
@@ -23,4 +36,5 @@ class HandlerOfflineRunners(AsgHandler):
                     gh_runner_ensure_absent(
                         repository=self.asg_spec.repository,
                         runner_id=runner.id,
+                        org=runner.org,
                     )
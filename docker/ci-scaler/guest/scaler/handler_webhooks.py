@@ -5,6 +5,7 @@ import hashlib
 import hmac
 import os.path
 import re
+import threading
 import time
 from api_gh import (
     gh_fetch_workflow,
@@ -16,16 +17,18 @@ from api_gh import (
 from api_aws import (
     DRY_RUN_MSG,
     aws_autoscaling_increment_desired_capacity,
-    aws_cloudwatch_put_metric_data,
 )
 from helpers import (
+    KeyedWorkQueue,
     PostJsonHttpRequestHandler,
     AsgSpec,
     log,
     logged_result,
 )
+from metrics import MetricsBuffer
 from storage import StorageFactory
-from typing import Any, Literal
+from concurrent.futures import Future
+from typing import Any, Callable, Literal
 from zlib import crc32
 
 
@@ -45,6 +48,8 @@ IGNORE_KEYS = [
 ]
 URL_PATH = "/ci-storage"
 WEBHOOK_ENSURE_EXISTS_INTERVAL_SEC = 60
+WORK_QUEUE_WORKERS = 8
+WORK_QUEUE_MAX_DEPTH = 10000
 
 
 @dataclasses.dataclass
@@ -53,6 +58,67 @@ class Webhook:
     ensure_exists_at: int
 
 
+@dataclasses.dataclass
+class AsgIncrement:
+    inc: int
+    events: int
+    desired_capacity: int | None = None
+
+
+#
+# Coalesces desired capacity increments of auto-scaling groups. Increments
+# requested within window_sec are summed up per group, and then each group gets
+# just one describe plus one clamped set call instead of one pair per event
+# (which would also race each other's read-modify-write). Every requester
+# receives the merged result for the groups it asked about.
+#
+class AsgIncrementAggregator:
+    def __init__(self, *, window_sec: float):
+        self.window_sec = window_sec
+        self._requests: list[
+            tuple[dict[str, int], Future[dict[str, AsgIncrement]]]
+        ] = []
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+
+    def increment(self, incs: dict[str, int]) -> Future[dict[str, AsgIncrement]]:
+        future: Future[dict[str, AsgIncrement]] = Future()
+        with self._lock:
+            if not self._requests:
+                timer = threading.Timer(self.window_sec, self._apply)
+                timer.daemon = True
+                timer.start()
+            self._requests.append((incs, future))
+        return future
+
+    def _apply(self):
+        # Windows may overlap when AWS is slow, but their calls must not.
+        with self._apply_lock:
+            with self._lock:
+                requests, self._requests = self._requests, []
+            totals: dict[str, AsgIncrement] = {}
+            for incs, _ in requests:
+                for asg_name, inc in incs.items():
+                    total = totals.setdefault(asg_name, AsgIncrement(inc=0, events=0))
+                    total.inc += inc
+                    total.events += 1
+            errors: dict[str, Exception] = {}
+            for asg_name, total in totals.items():
+                try:
+                    total.desired_capacity = aws_autoscaling_increment_desired_capacity(
+                        asg_name=asg_name,
+                        inc=total.inc,
+                    )
+                except Exception as e:
+                    errors[asg_name] = e
+            for incs, future in requests:
+                error = next((errors[name] for name in incs if name in errors), None)
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result({name: totals[name] for name in incs})
+
+
 @dataclasses.dataclass
 class JobTiming:
     job_id: int
@@ -69,26 +135,43 @@ class HandlerWebhooks:
         domain: str,
         asg_specs: list[AsgSpec],
         storage: StorageFactory,
+        metrics: MetricsBuffer,
+        increment_window_sec: float,
     ):
         self.domain = domain
         self.asg_specs = asg_specs
+        self.metrics = metrics
+        self.asg_increments = AsgIncrementAggregator(window_sec=increment_window_sec)
         self.webhooks: dict[str, Webhook] = {}
         self.secret = gh_get_webhook_secret()
+        # Dedup marks are removed when processing of an event fails (so its
+        # redelivery to any instance is processed), and timings are updated in
+        # place by whichever instance receives the next event of a job, so both
+        # must always be read fresh.
         self.duplicated_events = storage.create(
             int,
             ttl=DUPLICATED_EVENTS_TTL,
             name="duplicated-events",
+            cache_ttl=0,
         )
         self.job_timings = storage.create(
             JobTiming,
             ttl=JOB_TIMING_TTL,
             name="job-timings",
+            cache_ttl=0,
         )
         self.workflows = storage.create(
             dict[str, Any],
             ttl=WORKFLOW_TTL,
             name="workflows",
         )
+        self.work_queue = KeyedWorkQueue(
+            name="webhook-worker",
+            workers=WORK_QUEUE_WORKERS,
+            max_depth=WORK_QUEUE_MAX_DEPTH,
+        )
+        self._duplicated_events_lock = threading.Lock()
+        self._stopped = threading.Event()
         this = self
 
         class RequestHandler(PostJsonHttpRequestHandler):
@@ -113,9 +196,11 @@ class HandlerWebhooks:
                     url=url,
                     ensure_exists_at=int(time.time()),
                 )
+        threading.Thread(target=self._ensure_webhooks_thread, daemon=True).start()
         return self
 
     def __exit__(self, *_: Any):
+        self._stopped.set()
         for repository, webhook in self.webhooks.items():
             with logged_result(
                 swallow=True,
@@ -123,17 +208,15 @@ class HandlerWebhooks:
             ):
                 gh_webhook_ensure_absent(repository=repository, url=webhook.url)
 
-    def service_actions(self):
-        if not self.secret:
-            return
+    def _ensure_webhooks_thread(self):
         # We re-register webhooks periodically, since they may be de-registered
         # when one of the ci-scaler hosts terminates. In this case, all other
         # remaining hosts (in the load balancing group) will recreate the
-        # webhooks eventually.
-        for repository, webhook in self.webhooks.items():
-            now = int(time.time())
-            if now > webhook.ensure_exists_at + WEBHOOK_ENSURE_EXISTS_INTERVAL_SEC:
-                webhook.ensure_exists_at = now
+        # webhooks eventually. It runs in its own thread to not delay serving.
+        while not self._stopped.wait(WEBHOOK_ENSURE_EXISTS_INTERVAL_SEC):
+            for repository, webhook in self.webhooks.items():
+                assert self.secret
+                webhook.ensure_exists_at = int(time.time())
                 with logged_result(swallow=True):
                     res = gh_webhook_ensure_exists(
                         repository=repository,
@@ -250,48 +333,16 @@ class HandlerWebhooks:
 
             event_key = f"{workflow_run['id']}:{workflow_run['run_attempt']}"
             handler.log_suffix += f" id={event_key}"
-            processed_at = self.duplicated_events.get(event_key)
-            if processed_at:
-                return handler.send_json(
-                    202,
-                    message=f"ignoring event that has already been processed at {time.ctime(processed_at)}",
-                )
-
-            head_sha = str(workflow_run["head_sha"])
-            path = str(workflow_run["path"])
-            message = f"{repository}{event_key}: downloading {os.path.basename(path)} and parsing jobs list"
-            try:
-                cache_key = f"{repository}:{path}"
-                workflow = self.workflows.get(cache_key, None)
-                if not workflow:
-                    workflow = gh_fetch_workflow(
-                        repository=repository,
-                        sha=head_sha,
-                        path=path,
-                    )
-                    self.workflows[cache_key] = workflow
-                else:
-                    message += f" (cached)"
-                labels = extra_debug_labels | gh_predict_workflow_labels(
-                    workflow=workflow,
-                    known_labels=[
-                        asg_spec.label
-                        for asg_spec in self.asg_specs
-                        if asg_spec.repository == repository
-                    ],
-                )
-                log(
-                    f"{message}... "
-                    + " ".join([f"{k}:+{v}" for k, v in labels.items()])
-                )
-            except Exception as e:
-                return handler.send_error(500, f"{message} failed: {e}")
-
-            self.duplicated_events[event_key] = int(time.time())
-            return self._handle_workflow_run_in_progress(
+            return self._enqueue(
                 handler=handler,
                 repository=repository,
-                labels=labels,
+                event_key=event_key,
+                work=lambda: self._handle_workflow_run_in_progress(
+                    repository=repository,
+                    head_sha=str(workflow_run["head_sha"]),
+                    path=str(workflow_run["path"]),
+                    extra_debug_labels=extra_debug_labels,
+                ),
             )
 
         # This event is only used for statistics about timing.
@@ -304,21 +355,17 @@ class HandlerWebhooks:
                 )
 
             event_key = f"{workflow_job['id']}:{workflow_job['run_attempt']}:{action}"
-            processed_at = self.duplicated_events.get(event_key)
-            if processed_at:
-                return handler.send_json(
-                    202,
-                    message=f"ignoring event that has already been processed at {time.ctime(processed_at)}",
-                )
-
-            self.duplicated_events[event_key] = int(time.time())
-            return self._handle_workflow_job_timing(
+            return self._enqueue(
                 handler=handler,
                 repository=repository,
-                labels={label: 1 for label in workflow_job["labels"]},
-                action=action,
-                job_id=int(workflow_job["id"]),
-                name=name,
+                event_key=event_key,
+                work=lambda: self._handle_workflow_job_timing(
+                    repository=repository,
+                    labels={label: 1 for label in workflow_job["labels"]},
+                    action=action,
+                    job_id=int(workflow_job["id"]),
+                    name=name,
+                ),
             )
 
         # Unrecognized event, skipping.
@@ -327,58 +374,152 @@ class HandlerWebhooks:
             message=f"ignoring event with no {WORKFLOW_RUN_EVENT} and {WORKFLOW_JOB_EVENT}",
         )
 
-    def _handle_workflow_run_in_progress(
+    def _enqueue(
         self,
         *,
         handler: PostJsonHttpRequestHandler,
         repository: str,
-        labels: dict[str, int] = {},
+        event_key: str,
+        work: Callable[[], str | Future[str]],
     ):
-        messages: list[str] = []
-        has_aws = False
-        for asg_spec in self.asg_specs:
-            if asg_spec.repository == repository and asg_spec.label in labels:
-                inc = labels[asg_spec.label]
-                res = aws_autoscaling_increment_desired_capacity(
-                    asg_name=asg_spec.asg_name,
-                    inc=inc,
+        with self._duplicated_events_lock:
+            processed_at = self.duplicated_events.get(event_key)
+            if processed_at:
+                return handler.send_json(
+                    202,
+                    message=f"ignoring event that has already been processed at {time.ctime(processed_at)}",
                 )
-                has_aws = has_aws or res
-                messages.append(f"{asg_spec}:+{inc}")
+            self.duplicated_events[event_key] = int(time.time())
 
-        if not messages:
-            # Most likely, it's a GitHub-hosted action runner's label.
-            return handler.send_json(
-                202,
-                message=f"ignoring event, since no matching auto-scaling group(s) found for repository {repository} and labels {[*labels.keys()]}",
+        def report(get_message: Callable[[], str | Future[str]]):
+            ok = False
+            with logged_result(
+                swallow=True,
+                failure=f"{repository} {event_key}: processing failed",
+            ):
+                message = get_message()
+                if isinstance(message, Future):
+                    # The rest of the work is deferred (e.g. it waits to be
+                    # coalesced with other events), so report when it's done.
+                    message.add_done_callback(lambda future: report(future.result))
+                    return
+                log(f"{repository} {event_key}: {message}")
+                ok = True
+            if not ok:
+                # Let a redelivery of this event be processed again.
+                del self.duplicated_events[event_key]
+
+        # Events of one repository are processed in order, since e.g. timings
+        # of a job are built from its consecutive events.
+        if not self.work_queue.submit(key=repository, work=lambda: report(work)):
+            del self.duplicated_events[event_key]
+            return handler.send_error(
+                503,
+                f"work queue is full ({self.work_queue.depth} events)",
             )
-
         return handler.send_json(
-            200,
-            message=f"updated desired capacity: {', '.join(messages)}"
-            + (f" {DRY_RUN_MSG}" if not has_aws else ""),
+            202,
+            json={"message": "queued", "queue_depth": self.work_queue.depth},
+            message=f"queued (queue depth {self.work_queue.depth})",
+        )
+
+    def _handle_workflow_run_in_progress(
+        self,
+        *,
+        repository: str,
+        head_sha: str,
+        path: str,
+        extra_debug_labels: dict[str, int],
+    ) -> str | Future[str]:
+        message = f"downloading {os.path.basename(path)} and parsing jobs list"
+        cache_key = f"{repository}:{path}"
+        workflow = self.workflows.get(cache_key, None)
+        if not workflow:
+            workflow = gh_fetch_workflow(
+                repository=repository,
+                sha=head_sha,
+                path=path,
+            )
+            self.workflows[cache_key] = workflow
+        else:
+            message += f" (cached)"
+        labels = extra_debug_labels | gh_predict_workflow_labels(
+            workflow=workflow,
+            known_labels=[
+                asg_spec.label
+                for asg_spec in self.asg_specs
+                if asg_spec.repository == repository
+            ],
+        )
+        log(
+            f"{repository}: {message}... "
+            + " ".join([f"{k}:+{v}" for k, v in labels.items()])
         )
 
+        asg_specs = [
+            asg_spec
+            for asg_spec in self.asg_specs
+            if asg_spec.repository == repository and asg_spec.label in labels
+        ]
+        if not asg_specs:
+            # Most likely, it's a GitHub-hosted action runner's label.
+            return f"ignoring event, since no matching auto-scaling group(s) found for repository {repository} and labels {[*labels.keys()]}"
+
+        incs: dict[str, int] = {}
+        for asg_spec in asg_specs:
+            incs[asg_spec.asg_name] = (
+                incs.get(asg_spec.asg_name, 0) + labels[asg_spec.label]
+            )
+
+        def format_message(totals: dict[str, AsgIncrement]) -> str:
+            messages: list[str] = []
+            for asg_spec in asg_specs:
+                total = totals[asg_spec.asg_name]
+                messages.append(
+                    f"{asg_spec}:+{labels[asg_spec.label]}"
+                    + (
+                        f" (merged with {total.events - 1} more event(s) into +{total.inc})"
+                        if total.events > 1
+                        else ""
+                    )
+                    + (
+                        f" -> {total.desired_capacity}"
+                        if total.desired_capacity is not None
+                        else ""
+                    )
+                )
+            has_aws = any(t.desired_capacity is not None for t in totals.values())
+            return f"updated desired capacity: {', '.join(messages)}" + (
+                f" {DRY_RUN_MSG}" if not has_aws else ""
+            )
+
+        future: Future[str] = Future()
+
+        def on_done(totals: Future[dict[str, AsgIncrement]]):
+            try:
+                future.set_result(format_message(totals.result()))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.asg_increments.increment(incs).add_done_callback(on_done)
+        return future
+
     def _handle_workflow_job_timing(
         self,
         *,
-        handler: PostJsonHttpRequestHandler,
         repository: str,
         labels: dict[str, int],
         action: Literal["queued", "in_progress", "completed"],
         job_id: int,
         name: str | None,
-    ):
+    ) -> str:
         asg_spec: AsgSpec | None = None
         for asg in self.asg_specs:
             if asg.repository == repository and asg.label in labels:
                 asg_spec = asg
                 break
         if not asg_spec:
-            return handler.send_json(
-                202,
-                message=f"ignoring event, since no matching auto-scaling group(s) found for repository {repository} and labels {[*labels.keys()]}",
-            )
+            return f"ignoring event, since no matching auto-scaling group(s) found for repository {repository} and labels {[*labels.keys()]}"
 
         timing = self.job_timings.get(str(job_id))
         if timing is None:
@@ -438,7 +579,7 @@ class HandlerWebhooks:
                 if name
                 else None
             )
-            has_aws = aws_cloudwatch_put_metric_data(
+            has_aws = self.metrics.add(
                 metrics=metrics,
                 dimensions={
                     "GH_REPOSITORY": asg_spec.repository,
@@ -452,16 +593,10 @@ class HandlerWebhooks:
                 + (f" {DRY_RUN_MSG}" if not has_aws else "")
             )
 
-        return handler.send_json(
-            200,
-            message=(
-                f"logged timing event for job_id={job_id}: {asg_spec}, "
-                + (
-                    ", ".join(f"{k}:{v}" for k, v in metrics.items())
-                    if metrics
-                    else "no metrics yet"
-                )
-            ),
+        return f"logged timing event for job_id={job_id}: {asg_spec}, " + (
+            ", ".join(f"{k}:{v}" for k, v in metrics.items())
+            if metrics
+            else "no metrics yet"
         )
 
 
@@ -1,6 +1,9 @@
 import argparse
+import collections
 import dataclasses
+import http.client
 import http.server
+import queue
 import re
 import shlex
 import signal
@@ -10,10 +13,14 @@ import textwrap
 import threading
 import time
 import traceback
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from http import HTTPStatus
 from json import dumps, loads, JSONDecodeError, decoder
 from types import TracebackType
-from typing import Any, Callable, Iterable, Literal
+from typing import Any, Callable, Iterable, Literal, TypeVar
+
+T = TypeVar("T")
 
 C_RED = "\033[1;31m"
 C_GRAY = "\033[1;30m"
@@ -27,10 +34,12 @@ def log(msg: str, *, error: bool = False):
     date = time.strftime("%d/%b/%Y %H:%M:%S") + " " + ("E" if error else "I")
     prefix = (C_RED if error else C_GRAY) + f"[{date}] "
     suffix = C_END
-    print(
-        "\n".join([f"{prefix}{s}{suffix}" for s in msg.splitlines()]).rstrip(),
-        file=sys.stderr,
+    # Written with one call, so messages of concurrent threads don't interleave.
+    sys.stderr.write(
+        "\n".join([f"{prefix}{s}{suffix}" for s in msg.splitlines()]).rstrip()
+        + "\n"
     )
+    sys.stderr.flush()
 
 
 #
@@ -146,6 +155,73 @@ class CalledProcessError(subprocess.CalledProcessError):
         return msg
 
 
+#
+# A thread-safe pool of keep-alive HTTP(S) connections to one host. Each
+# request takes an idle connection from the pool (or opens a new one) and
+# returns it back when done, so repeated calls to the same API skip the TCP and
+# TLS handshakes.
+#
+class HttpConnectionPool:
+    def __init__(self, *, url: str, size: int, timeout: float):
+        parsed = urllib.parse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        self.size = size
+        self.timeout = timeout
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        body: bytes | None,
+        headers: dict[str, str],
+    ) -> tuple[int, http.client.HTTPMessage, bytes]:
+        conn, reused = self._acquire()
+        try:
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                res = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection, so the
+                # request didn't reach it: retry on a fresh connection.
+                conn.close()
+                conn = self._connect()
+                conn.request(method, path, body=body, headers=headers)
+                res = conn.getresponse()
+            data = res.read()
+        except BaseException:
+            conn.close()
+            raise
+        if res.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return res.status, res.headers, data
+
+    def _acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "http":
+            return http.client.HTTPConnection(self.host, timeout=self.timeout)
+        return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+
+
 #
 # A helper class for ArgumentParser.
 #
@@ -192,6 +268,7 @@ class Runner:
     busy: bool
     labels: list[str]
     loaded_at: int
+    org: str | None = None  # set if registered at the organization level
 
     def instance_id(self) -> str:
         match = re.match(r"^ci-storage-(\w+)", self.name)
@@ -213,23 +290,218 @@ class RunnersRegistry(dict[str, Runner]):
             del self[id]
 
 
+#
+# A snapshot of an auto-scaling group state.
+#
+@dataclasses.dataclass
+class AsgDescription:
+    desired_capacity: int
+    min_size: int
+    max_size: int
+    instance_ids: list[str]
+
+
+#
+# Runners fetched in one poll iteration indexed by repository and label, so the
+# handlers of each auto-scaling group get their slice with a lookup.
+#
+class RunnersIndex:
+    def __init__(self):
+        self._runners: dict[tuple[str, str], list[Runner]] = {}
+
+    def add(self, runner: Runner, *, repositories: Iterable[str]) -> None:
+        for repository in repositories:
+            for label in runner.labels:
+                self._runners.setdefault((repository, label), []).append(runner)
+
+    #
+    # Returns the runners of each spec. An organization runner is visible to
+    # many repositories, but it must be handled by one spec only (otherwise,
+    # the specs of other groups would treat it as a runner with no instance in
+    # their group, and the specs of the same group would count it twice). So
+    # it's given to the first spec whose group has the runner's instance, or to
+    # the first spec which sees it if there is no such group (so a runner with
+    # a vanished instance is still cleaned up).
+    #
+    def assign(
+        self,
+        *,
+        asg_specs: Iterable[AsgSpec],
+        asg_descriptions: dict[str, AsgDescription] | None,
+    ) -> dict[AsgSpec, list[Runner]]:
+        def owns(asg_spec: AsgSpec, runner: Runner) -> bool:
+            asg_description = (asg_descriptions or {}).get(asg_spec.asg_name)
+            try:
+                instance_id = runner.instance_id()
+            except ValueError:
+                return False
+            return bool(asg_description) and instance_id in asg_description.instance_ids
+
+        res: dict[AsgSpec, list[Runner]] = {}
+        owners: dict[str, tuple[AsgSpec, Runner]] = {}
+        for asg_spec in asg_specs:
+            res.setdefault(asg_spec, [])
+            for runner in self._runners.get((asg_spec.repository, asg_spec.label), []):
+                if not runner.org:
+                    res[asg_spec].append(runner)
+                    continue
+                owner = owners.get(runner.id)
+                if not owner or (not owns(owner[0], runner) and owns(asg_spec, runner)):
+                    owners[runner.id] = (asg_spec, runner)
+        for asg_spec, runner in owners.values():
+            res[asg_spec].append(runner)
+        return res
+
+
 #
 # A handling class for one auto-scaling group. A concrete derived class reacts
 # on the list of runners (just fetched from GitHub API) related to this
 # auto-scaling group (i.e. the runners in a particular repository labelled with
-# a particular label).
+# a particular label) and on the group's description fetched in the same poll
+# iteration (None if there is no AWS access).
 #
 class AsgHandler:
+    # If the auto-scaling group can't be described (e.g. AWS API fails), the
+    # handlers which require its description are not run at all, and the rest
+    # of them get None (same as in DRY-RUN mode).
+    requires_asg_description = True
+
     def __init__(self, *, asg_spec: AsgSpec):
         self.asg_spec = asg_spec
 
     def __str__(self):
         return f"{self.__class__.__name__}({self.asg_spec})"
 
-    def handle(self, runners: list[Runner]) -> None:
+    def handle(
+        self,
+        runners: list[Runner],
+        asg_description: AsgDescription | None,
+    ) -> None:
         raise NotImplementedError()
 
 
+#
+# A bounded pool of worker threads running submitted work items. Items with the
+# same key run one after another in the order of submission, and items with
+# different keys run in parallel. When more than max_depth items are waiting,
+# submit() refuses to accept a new one.
+#
+class KeyedWorkQueue:
+    def __init__(self, *, name: str, workers: int, max_depth: int):
+        self.name = name
+        self.max_depth = max_depth
+        self._pending: dict[str, collections.deque[Callable[[], None]]] = {}
+        self._ready: queue.SimpleQueue[str] = queue.SimpleQueue()
+        self._depth = 0
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(
+                target=self._worker,
+                name=f"{name}-{i}",
+                daemon=True,
+            ).start()
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def submit(self, *, key: str, work: Callable[[], None]) -> bool:
+        with self._lock:
+            if self._depth >= self.max_depth:
+                return False
+            self._depth += 1
+            if key in self._pending:
+                self._pending[key].append(work)
+            else:
+                self._pending[key] = collections.deque([work])
+                self._ready.put(key)
+        return True
+
+    def _worker(self):
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                work = self._pending[key][0]
+            with logged_result(swallow=True, failure=f"Error in {self.name}"):
+                work()
+            with self._lock:
+                self._depth -= 1
+                items = self._pending[key]
+                items.popleft()
+                if items:
+                    # Let other keys go first before the next item of this one.
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+
+
+#
+# Runs named stages of a poll cycle on a bounded pool of threads and measures
+# their durations. A stage is not started again while its previous run (e.g.
+# the one which outlived its cycle's deadline) is still in progress, since
+# handlers are not meant to run concurrently with themselves.
+#
+class PollStages:
+    def __init__(self, *, workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="poll",
+        )
+        self._running: dict[str, Future[Any]] = {}
+        self._durations: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def start_cycle(self) -> None:
+        with self._lock:
+            self._durations = {}
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[[], T],
+        *,
+        failure: str,
+    ) -> Future[T | None] | None:
+        prev = self._running.get(name)
+        if prev and not prev.done():
+            log(f"Skipping {name}, since its previous run is still in progress")
+            return None
+        future = self._executor.submit(self._run, name, fn, failure)
+        self._running[name] = future
+        return future
+
+    def wait(self, futures: Iterable[Future[Any] | None], *, deadline: float) -> None:
+        wait(
+            [future for future in futures if future],
+            timeout=max(deadline - time.time(), 0),
+        )
+
+    def result(self, future: Future[T | None] | None) -> T | None:
+        return future.result() if future and future.done() else None
+
+    def log_cycle(self, *, started_at: float) -> None:
+        with self._lock:
+            durations = dict(self._durations)
+        slowest = max(durations.items(), key=lambda item: item[1], default=None)
+        unfinished = [name for name, f in self._running.items() if not f.done()]
+        log(
+            f"Poll cycle took {time.time() - started_at:.1f} sec"
+            + (f", slowest stage: {slowest[0]} ({slowest[1]:.1f} sec)" if slowest else "")
+            + (f"; not finished in time: {', '.join(unfinished)}" if unfinished else ""),
+            error=bool(unfinished),
+        )
+
+    def _run(self, name: str, fn: Callable[[], T], failure: str) -> T | None:
+        started_at = time.time()
+        try:
+            with logged_result(swallow=True, failure=failure):
+                return fn()
+            return None
+        finally:
+            with self._lock:
+                self._durations[name] = time.time() - started_at
+
+
 #
 # An information about rate limits.
 #
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 __import__("sys").dont_write_bytecode = True
 import argparse
+import functools
 import re
 import socketserver
 import threading
 import time
-from api_gh import gh_fetch_runners
+from api_aws import aws_autoscaling_describe_auto_scaling_groups
+from api_gh import gh_fetch_org_runners, gh_fetch_runners
 from handler_cloudwatch_rate_limits import HandlerCloudWatchRateLimits
 from handler_cloudwatch_runners import HandlerCloudWatchRunners
 from handler_idle_runners import HandlerIdleRunners
@@ -14,14 +16,17 @@ from handler_webhooks import HandlerWebhooks
 from helpers import (
     AsgHandler,
     AsgSpec,
-    logged_result,
     log,
     ParagraphFormatter,
-    Runner,
+    PollStages,
+    RunnersIndex,
     wrap_main,
 )
+from metrics import MetricsBuffer
 from storage import StorageFactory
 
+POLL_WORKERS = 16
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -85,6 +90,18 @@ def main():
         default=1200,
         help="offline runners will be de-registered after this time",
     )
+    parser.add_argument(
+        "--runners-org",
+        type=str,
+        default=None,
+        help="if set, poll self-hosted runners of this GitHub organization in one sweep for all its repositories (following runner groups visibility) instead of polling runners of each repository separately; useful when runners are registered at the organization level",
+    )
+    parser.add_argument(
+        "--increment-window-sec",
+        type=float,
+        default=0.3,
+        help="desired capacity increments for the same auto-scaling group requested by webhook events within this window are merged into one update",
+    )
     parser.add_argument(
         "--dynamodb-table-prefix",
         type=str,
@@ -99,14 +116,24 @@ def main():
     poll_interval_sec = int(args.poll_interval_sec)
     max_idle_age_sec = int(args.max_idle_age_sec)
     max_offline_age_sec = int(args.max_offline_age_sec)
+    increment_window_sec = float(args.increment_window_sec)
+    runners_org = str(args.runners_org or "") or None
+    repositories = sorted(set(asg_spec.repository for asg_spec in asg_specs))
+    org_repositories = [
+        repository
+        for repository in repositories
+        if runners_org and repository.split("/")[0].lower() == runners_org.lower()
+    ]
     storage = StorageFactory(dynamodb_table_prefix=args.dynamodb_table_prefix or None)
 
-    handler_cloudwatch_rate_limits = HandlerCloudWatchRateLimits()
+    metrics = MetricsBuffer()
+
+    handler_cloudwatch_rate_limits = HandlerCloudWatchRateLimits(metrics=metrics)
     handlers_asg: dict[AsgSpec, list[AsgHandler]] = {}
     for asg_spec in asg_specs:
         handlers_asg.setdefault(asg_spec, []).extend(
             [
-                HandlerCloudWatchRunners(asg_spec=asg_spec),
+                HandlerCloudWatchRunners(asg_spec=asg_spec, metrics=metrics),
                 HandlerIdleRunners(
                     asg_spec=asg_spec,
                     max_idle_age_sec=max_idle_age_sec,
@@ -119,50 +146,141 @@ def main():
             ]
         )
 
+    stages = PollStages(workers=POLL_WORKERS)
+
     def poll_thread():
+        # Ticks follow a fixed cadence, and all API calls of a tick run in
+        # parallel, so the cycle doesn't drift by the sum of their latencies.
+        # Whatever isn't done by the next tick is reported and not awaited.
+        next_tick_at = time.time()
         while True:
-            runners_by_repository: dict[str, list[Runner]] = {}
-            for repository in set(asg_spec.repository for asg_spec in asg_specs):
-                with logged_result(
-                    swallow=True,
-                    failure=f"Error fetching runners (will retry in {poll_interval_sec} sec)",
-                ):
-                    runners_by_repository[repository] = gh_fetch_runners(
-                        repository=repository
+            started_at = time.time()
+            deadline = started_at + poll_interval_sec
+            stages.start_cycle()
+            rate_limits_future = stages.submit(
+                str(handler_cloudwatch_rate_limits),
+                handler_cloudwatch_rate_limits.handle,
+                failure=f"Error in {handler_cloudwatch_rate_limits}",
+            )
+            runners_futures = {
+                repository: stages.submit(
+                    f"fetching runners of {repository}",
+                    functools.partial(gh_fetch_runners, repository=repository),
+                    failure=f"Error fetching runners of {repository} (will retry in {poll_interval_sec} sec)",
+                )
+                for repository in repositories
+                if repository not in org_repositories
+            }
+            org_runners_future = (
+                stages.submit(
+                    f"fetching runners of {runners_org}",
+                    functools.partial(gh_fetch_org_runners, org=runners_org),
+                    failure=f"Error fetching runners of {runners_org} (will retry in {poll_interval_sec} sec)",
+                )
+                if runners_org and org_repositories
+                else None
+            )
+            # One batched call for all groups, shared by all handlers. It's
+            # wrapped into a tuple to tell a failure from a DRY-RUN None.
+            describe_future = stages.submit(
+                "describing auto-scaling groups",
+                lambda: (
+                    aws_autoscaling_describe_auto_scaling_groups(
+                        asg_names=sorted(set(s.asg_name for s in asg_specs))
+                    ),
+                ),
+                failure=f"Error describing auto-scaling groups (will retry in {poll_interval_sec} sec)",
+            )
+            stages.wait(
+                [*runners_futures.values(), org_runners_future, describe_future],
+                deadline=deadline,
+            )
+
+            runners_index = RunnersIndex()
+            fetched_repositories: set[str] = set()
+            for repository, runners_future in runners_futures.items():
+                runners = stages.result(runners_future)
+                if runners is not None:
+                    fetched_repositories.add(repository)
+                    for runner in runners:
+                        runners_index.add(runner, repositories=[repository])
+            org_runners = stages.result(org_runners_future)
+            if org_runners is not None:
+                fetched_repositories.update(org_repositories)
+                for runner, visible_repositories in org_runners:
+                    runners_index.add(
+                        runner,
+                        repositories=[
+                            repository
+                            for repository in org_repositories
+                            if visible_repositories is None
+                            or repository.lower() in visible_repositories
+                        ],
                     )
+
+            described = stages.result(describe_future)
+            asg_descriptions = described[0] if described else None
+            runners_by_spec = runners_index.assign(
+                asg_specs=asg_specs,
+                asg_descriptions=asg_descriptions,
+            )
+            handler_futures = []
             for asg_spec in asg_specs:
-                if asg_spec.repository not in runners_by_repository:
+                if asg_spec.repository not in fetched_repositories:
                     continue
+                asg_description = (
+                    asg_descriptions.get(asg_spec.asg_name)
+                    if asg_descriptions is not None
+                    else None
+                )
+                if asg_descriptions is not None and not asg_description:
+                    log(f"AutoScalingGroup {asg_spec.asg_name} not found", error=True)
+                # If describing failed or the group is not found, the handlers
+                # which don't need AWS (like the offline runners cleanup) still
+                # run. In DRY-RUN mode, there are no descriptions at all.
+                described_ok = bool(described) and (
+                    asg_descriptions is None or asg_description is not None
+                )
+                asg_runners = runners_by_spec[asg_spec]
                 for handler in handlers_asg.get(asg_spec, []):
-                    with logged_result(swallow=True, failure=f"Error in {handler}"):
-                        handler.handle(
-                            [
-                                runner
-                                for runner in runners_by_repository[asg_spec.repository]
-                                if asg_spec.label in runner.labels
-                            ]
+                    if handler.requires_asg_description and not described_ok:
+                        continue
+                    handler_futures.append(
+                        stages.submit(
+                            # Specs may differ by the group name only.
+                            f"{handler} for {asg_spec.asg_name}",
+                            functools.partial(
+                                handler.handle,
+                                asg_runners,
+                                asg_description,
+                            ),
+                            failure=f"Error in {handler}",
                         )
-            with logged_result(
-                swallow=True,
-                failure=f"Error in {handler_cloudwatch_rate_limits}",
-            ):
-                handler_cloudwatch_rate_limits.handle()
-            time.sleep(poll_interval_sec)
+                    )
+            stages.wait([*handler_futures, rate_limits_future], deadline=deadline)
+            stages.log_cycle(started_at=started_at)
+
+            now = time.time()
+            while next_tick_at <= now:
+                next_tick_at += poll_interval_sec
+            time.sleep(next_tick_at - now)
 
     with HandlerWebhooks(
         domain=domain,
         asg_specs=asg_specs,
         storage=storage,
+        metrics=metrics,
+        increment_window_sec=increment_window_sec,
     ) as webhooks:
-        with socketserver.TCPServer(
+        with socketserver.ThreadingTCPServer(
             ("", port),
             webhooks.RequestHandler,
             bind_and_activate=False,
         ) as httpd:
             httpd.allow_reuse_port = True
+            httpd.daemon_threads = True
             httpd.server_bind()
             httpd.server_activate()
-            httpd.service_actions = webhooks.service_actions
             log(f"Listening for webhook events on port {port}")
             thread = threading.Thread(
                 target=lambda: wrap_main(poll_thread),
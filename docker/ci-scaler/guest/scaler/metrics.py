@@ -0,0 +1,102 @@
+import atexit
+import threading
+import time
+from api_aws import MetricDatum, aws_cloudwatch_put_metric_data, aws_region
+from helpers import logged_result
+from typing import Literal
+
+METRICS_FLUSH_INTERVAL_SEC = 60
+METRICS_FLUSH_MAX_DATA = 1000
+
+
+#
+# Buffers CloudWatch metrics and publishes them in batches. Values of the same
+# metric with the same dimensions are aggregated locally into a statistic set
+# (count, sum, min and max), so e.g. thousands of job timings per minute cost a
+# handful of data points. The buffer is flushed from a background thread every
+# flush_interval_sec, or earlier once it holds max_data distinct data points,
+# and also at exit.
+#
+class MetricsBuffer:
+    def __init__(
+        self,
+        *,
+        flush_interval_sec: float = METRICS_FLUSH_INTERVAL_SEC,
+        max_data: int = METRICS_FLUSH_MAX_DATA,
+    ):
+        self.flush_interval_sec = flush_interval_sec
+        self.max_data = max_data
+        self._data: dict[tuple[str, tuple[tuple[str, str], ...]], MetricDatum] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        threading.Thread(target=self._flush_thread, daemon=True).start()
+        atexit.register(self.flush)
+
+    def add(
+        self,
+        *,
+        metrics: dict[str, int],
+        dimensions: dict[str, str],
+    ) -> Literal[True] | None:
+        if not aws_region():
+            return None
+        now = time.time()
+        with self._lock:
+            for name, value in metrics.items():
+                self._merge(
+                    MetricDatum(
+                        name=name,
+                        dimensions=dimensions,
+                        timestamp=now,
+                        count=1,
+                        sum=value,
+                        min=value,
+                        max=value,
+                    )
+                )
+            if len(self._data) >= self.max_data:
+                self._flush_requested.set()
+        return True
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                data, self._data = list(self._data.values()), {}
+            error: BaseException | None = None
+            for i in range(0, len(data), self.max_data):
+                chunk = data[i : i + self.max_data]
+                try:
+                    aws_cloudwatch_put_metric_data(data=chunk)
+                except BaseException as e:
+                    # Keep only what's not published for the next attempt,
+                    # since the counts and sums of statistic sets published
+                    # twice would be counted twice.
+                    error = e
+                    with self._lock:
+                        for datum in chunk:
+                            self._merge(datum)
+            if error:
+                raise error
+
+    def _merge(self, datum: MetricDatum) -> None:
+        key = (datum.name, tuple(sorted(datum.dimensions.items())))
+        existing = self._data.get(key)
+        if existing is None:
+            self._data[key] = datum
+        else:
+            existing.timestamp = min(existing.timestamp, datum.timestamp)
+            existing.count += datum.count
+            existing.sum += datum.sum
+            existing.min = min(existing.min, datum.min)
+            existing.max = max(existing.max, datum.max)
+
+    def _flush_thread(self) -> None:
+        while True:
+            self._flush_requested.wait(self.flush_interval_sec)
+            self._flush_requested.clear()
+            with logged_result(
+                swallow=True,
+                failure="Error publishing CloudWatch metrics (will retry)",
+            ):
+                self.flush()
@@ -1,56 +1,78 @@
+import atexit
 import dataclasses
 import math
-import subprocess
+import threading
 import time
-from api_aws import aws, aws_json
+from api_aws import AwsError, aws_dynamodb
+from collections import OrderedDict
+from helpers import log, logged_result
 from json import dumps, loads
-from typing import Any, Generic, Type, TypeVar
+from typing import Any, Generic, Iterable, Type, TypeVar
 
 V = TypeVar("V")
 
+SHARED_DICT_FLUSH_SEC = 0.1
+SHARED_DICT_FLUSH_RETRY_SEC = 5
+SHARED_DICT_FLUSH_MAX_FAILURES = 5
+SHARED_DICT_CACHE_TTL_SEC = 5
+SHARED_DICT_CACHE_MAX_SIZE = 10000
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_ATTEMPTS = 8
+BATCH_GET_MAX_KEYS = 100
+
 
 #
-# A dict-like class in memory with TTL-based expiration.
+# A dict-like class in memory with TTL-based expiration. Since the TTL is the
+# same for all keys, the store is kept in the order of writes, so expired keys
+# are always at its head, and evicting them costs amortized O(1) per write. If
+# max_size is set, the oldest keys are also evicted once it is exceeded. It's
+# safe to use from multiple threads.
 #
 class MemoryDict(Generic[V]):
-    def __init__(self, *, ttl: float):
+    def __init__(self, *, ttl: float, max_size: int | None = None):
         self.ttl = ttl
-        self._store: dict[str, V] = {}
-        self._times: dict[str, float] = {}
+        self.max_size = max_size
+        # key -> (written_at, value), oldest first
+        self._store: OrderedDict[str, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
 
-    def _is_expired(self, key: str) -> bool:
-        return time.time() - self._times.get(key, 0) > self.ttl
+    def _is_expired(self, written_at: float) -> bool:
+        return time.time() - written_at > self.ttl
 
     def _garbage_collect(self) -> None:
-        keys_to_delete = [key for key in self._store if self._is_expired(key)]
-        for key in keys_to_delete:
-            del self._store[key]
-            del self._times[key]
+        while self._store:
+            written_at, _ = next(iter(self._store.values()))
+            if not self._is_expired(written_at):
+                break
+            self._store.popitem(last=False)
+        while self.max_size is not None and len(self._store) > self.max_size:
+            self._store.popitem(last=False)
 
     def __setitem__(self, key: str, value: V):
-        self._garbage_collect()
-        self._store[key] = value
-        self._times[key] = time.time()
+        with self._lock:
+            self._store.pop(key, None)
+            self._store[key] = (time.time(), value)
+            self._garbage_collect()
 
     def __getitem__(self, key: str) -> V:
-        if key not in self._store or self._is_expired(key):
+        entry = self._store.get(key)
+        if entry is None or self._is_expired(entry[0]):
             raise KeyError(f"Key '{key}' not found or expired")
-        return self._store[key]
+        return entry[1]
 
     def __delitem__(self, key: str):
-        if key in self._store:
-            del self._store[key]
-            del self._times[key]
+        with self._lock:
+            self._store.pop(key, None)
 
     def __contains__(self, key: str):
-        return key in self._store and not self._is_expired(key)
+        entry = self._store.get(key)
+        return entry is not None and not self._is_expired(entry[0])
 
     def __repr__(self):
-        return (
-            "MemoryDict("
-            + str({k: v for k, v in self._store.items() if not self._is_expired(k)})
-            + ")"
-        )
+        with self._lock:
+            self._garbage_collect()
+            items = {key: value for key, (_, value) in self._store.items()}
+        return "MemoryDict(" + str(items) + ")"
 
     def get(self, key: str, default: V | None = None) -> V | None:
         try:
@@ -58,70 +80,92 @@ class MemoryDict(Generic[V]):
         except KeyError:
             return default
 
+    def get_many(self, keys: Iterable[str]) -> dict[str, V]:
+        return {key: self[key] for key in keys if key in self}
+
 
 #
 # A dict-like class backed by DynamoDB with TTL-based expiration. Drop-in
 # replacement for MemoryDict when shared state across instances is needed.
 # Automatically creates the DynamoDB table if it doesn't exist.
 #
+# Found items are cached locally for up to cache_ttl seconds (misses are never
+# cached, so an item written by another instance is not hidden by them). Pass
+# cache_ttl=0 for items which other instances modify or delete, like dedup
+# marks. Writes and deletes are buffered and flushed in the background with
+# BatchWriteItem every SHARED_DICT_FLUSH_SEC; reads of this instance see them
+# immediately. An item which fails to be written SHARED_DICT_FLUSH_MAX_FAILURES
+# times in a row (e.g. rejected by DynamoDB) is dropped with an error logged.
+#
 class SharedDict(Generic[V]):
-    def __init__(self, value_type: Type[V], *, ttl: float, table: str):
+    def __init__(
+        self,
+        value_type: Type[V],
+        *,
+        ttl: float,
+        table: str,
+        cache_ttl: float | None = None,
+    ):
         self.ttl = ttl
         self.table = table
         self.value_type = value_type
+        self.cache_ttl = SHARED_DICT_CACHE_TTL_SEC if cache_ttl is None else cache_ttl
+        # key -> (expires_at, serialized value)
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # key -> item to put, or None to delete
+        self._pending: dict[str, dict[str, Any] | None] = {}
+        # key -> number of failed flushes of its pending item in a row
+        self._failures: dict[str, int] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
         self._ensure_table()
+        threading.Thread(target=self._flush_thread, daemon=True).start()
+        atexit.register(self.flush)
 
     def _ensure_table(self) -> None:
         try:
-            aws(
-                "dynamodb",
-                "describe-table",
-                f"--table-name={self.table}",
-            )
-        except subprocess.CalledProcessError as e:
-            if "ResourceNotFoundException" not in (e.stderr or ""):
+            aws_dynamodb("DescribeTable", {"TableName": self.table})
+        except AwsError as e:
+            if e.code != "ResourceNotFoundException":
                 raise
-            aws(
-                "dynamodb",
-                "create-table",
-                f"--table-name={self.table}",
-                "--attribute-definitions",
-                "AttributeName=pk,AttributeType=S",
-                "--key-schema",
-                "AttributeName=pk,KeyType=HASH",
-                "--billing-mode=PAY_PER_REQUEST",
+            aws_dynamodb(
+                "CreateTable",
+                {
+                    "TableName": self.table,
+                    "AttributeDefinitions": [
+                        {"AttributeName": "pk", "AttributeType": "S"}
+                    ],
+                    "KeySchema": [{"AttributeName": "pk", "KeyType": "HASH"}],
+                    "BillingMode": "PAY_PER_REQUEST",
+                },
             )
             for _ in range(60):
-                res = aws_json(
-                    "dynamodb",
-                    "describe-table",
-                    f"--table-name={self.table}",
-                )
+                res = aws_dynamodb("DescribeTable", {"TableName": self.table})
                 if res and res["Table"]["TableStatus"] == "ACTIVE":
                     break
                 time.sleep(5)
-            aws(
-                "dynamodb",
-                "update-time-to-live",
-                f"--table-name={self.table}",
-                "--time-to-live-specification",
-                "Enabled=true,AttributeName=ttl",
+            aws_dynamodb(
+                "UpdateTimeToLive",
+                {
+                    "TableName": self.table,
+                    "TimeToLiveSpecification": {
+                        "Enabled": True,
+                        "AttributeName": "ttl",
+                    },
+                },
             )
 
     def __setitem__(self, key: str, value: V):
         ttl_epoch = math.floor(time.time() + self.ttl)
-        item_json = dumps(
+        self._enqueue(
+            key,
             {
                 "pk": {"S": key},
                 "val": {"S": dumps(value, default=_json_default)},
                 "ttl": {"N": str(ttl_epoch)},
-            }
-        )
-        aws(
-            "dynamodb",
-            "put-item",
-            f"--table-name={self.table}",
-            f"--item={item_json}",
+            },
         )
 
     def _deserialize(self, raw: Any) -> V:
@@ -130,46 +174,176 @@ class SharedDict(Generic[V]):
         else:
             return raw
 
-    def _get_item(self, key: str) -> V | None:
-        res = aws_json(
-            "dynamodb",
-            "get-item",
-            f"--table-name={self.table}",
-            f"--key={dumps({'pk': {'S': key}})}",
-            "--consistent-read",
-        )
-        if res is None or "Item" not in res:
-            return None
-        item = res["Item"]
-        ttl_val = int(item["ttl"]["N"])
-        if ttl_val < time.time():
-            return None
-        return self._deserialize(loads(item["val"]["S"]))
+    def _enqueue(self, key: str, item: dict[str, Any] | None) -> None:
+        with self._lock:
+            self._pending[key] = item
+            self._cache.pop(key, None)
+            self._version += 1
+        self._flush_requested.set()
+
+    def _cache_put(self, key: str, item: dict[str, Any], now: float) -> None:
+        expires_at = min(now + self.cache_ttl, int(item["ttl"]["N"]))
+        if expires_at <= now:
+            return
+        self._cache[key] = (expires_at, item["val"]["S"])
+        self._cache.move_to_end(key)
+        while len(self._cache) > SHARED_DICT_CACHE_MAX_SIZE:
+            self._cache.popitem(last=False)
+
+    def _get_items(self, keys: Iterable[str]) -> dict[str, str]:
+        now = time.time()
+        found: dict[str, str] = {}
+        missing: list[str] = []
+        with self._lock:
+            version = self._version
+            for key in dict.fromkeys(keys):
+                if key in self._pending:
+                    item = self._pending[key]
+                    if item is not None and int(item["ttl"]["N"]) >= now:
+                        found[key] = item["val"]["S"]
+                elif key in self._cache and self._cache[key][0] > now:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key][1]
+                else:
+                    missing.append(key)
+        for i in range(0, len(missing), BATCH_GET_MAX_KEYS):
+            keys_left = [
+                {"pk": {"S": key}} for key in missing[i : i + BATCH_GET_MAX_KEYS]
+            ]
+            while keys_left:
+                res = aws_dynamodb(
+                    "BatchGetItem",
+                    {
+                        "RequestItems": {
+                            self.table: {"Keys": keys_left, "ConsistentRead": True}
+                        }
+                    },
+                )
+                if res is None:
+                    break
+                with self._lock:
+                    # Don't let a read which raced with a local write put a
+                    # stale value into the cache.
+                    cacheable = self._version == version
+                    for item in res.get("Responses", {}).get(self.table, []):
+                        if int(item["ttl"]["N"]) >= now:
+                            found[item["pk"]["S"]] = item["val"]["S"]
+                            if cacheable:
+                                self._cache_put(item["pk"]["S"], item, now)
+                keys_left = (
+                    res.get("UnprocessedKeys", {}).get(self.table, {}).get("Keys", [])
+                )
+        return found
 
     def __getitem__(self, key: str) -> V:
-        value = self._get_item(key)
-        if value is None:
+        items = self._get_items([key])
+        if key not in items:
             raise KeyError(f"Key '{key}' not found or expired")
-        return value
+        return self._deserialize(loads(items[key]))
 
     def __delitem__(self, key: str):
-        aws(
-            "dynamodb",
-            "delete-item",
-            f"--table-name={self.table}",
-            f"--key={dumps({'pk': {'S': key}})}",
-        )
+        self._enqueue(key, None)
 
     def __contains__(self, key: str):
-        return self._get_item(key) is not None
+        return key in self._get_items([key])
+
+    def _flush_thread(self) -> None:
+        while True:
+            self._flush_requested.wait()
+            time.sleep(SHARED_DICT_FLUSH_SEC)
+            self._flush_requested.clear()
+            with logged_result(
+                swallow=True,
+                failure=f"Error flushing writes to {self.table} (will retry in {SHARED_DICT_FLUSH_RETRY_SEC} sec)",
+            ):
+                self.flush()
+                continue
+            time.sleep(SHARED_DICT_FLUSH_RETRY_SEC)
+            self._flush_requested.set()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+            # The items which failed before are written one by one, so an item
+            # rejected by DynamoDB doesn't hold back the others in its batch.
+            keys = [key for key in batch if key not in self._failures]
+            chunks = [[key] for key in batch if key in self._failures] + [
+                keys[i : i + BATCH_WRITE_MAX_ITEMS]
+                for i in range(0, len(keys), BATCH_WRITE_MAX_ITEMS)
+            ]
+            written: list[str] = []
+            dropped: list[str] = []
+            error: Exception | None = None
+            for chunk in chunks:
+                try:
+                    self._write(chunk, batch)
+                    written += chunk
+                except Exception as e:
+                    error = e
+                    for key in chunk:
+                        self._failures[key] = self._failures.get(key, 0) + 1
+                        if self._failures[key] >= SHARED_DICT_FLUSH_MAX_FAILURES:
+                            dropped.append(key)
+            for key in written + dropped:
+                self._failures.pop(key, None)
+            now = time.time()
+            with self._lock:
+                for key in written + dropped:
+                    # Keep the items which were overwritten during the flush.
+                    item = batch[key]
+                    if key in self._pending and self._pending[key] is item:
+                        del self._pending[key]
+                        if item is not None and key in written:
+                            self._cache_put(key, item, now)
+            if dropped:
+                log(
+                    f"Dropped {len(dropped)} item(s) which failed to be written to {self.table} {SHARED_DICT_FLUSH_MAX_FAILURES} times: {', '.join(dropped)}; last error: {error}",
+                    error=True,
+                )
+            # Let the caller retry the failed items which are not dropped yet.
+            if error and self._failures:
+                raise error
+
+    def _write(
+        self,
+        keys: list[str],
+        batch: dict[str, dict[str, Any] | None],
+    ) -> None:
+        requests_left = [
+            (
+                {"PutRequest": {"Item": batch[key]}}
+                if batch[key] is not None
+                else {"DeleteRequest": {"Key": {"pk": {"S": key}}}}
+            )
+            for key in keys
+        ]
+        for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(SHARED_DICT_FLUSH_SEC * 2**attempt)
+            res = aws_dynamodb(
+                "BatchWriteItem",
+                {"RequestItems": {self.table: requests_left}},
+            )
+            requests_left = (res or {}).get("UnprocessedItems", {}).get(self.table, [])
+            if not requests_left:
+                return
+        raise ValueError(
+            f"BatchWriteItem left {len(requests_left)} item(s) unprocessed"
+        )
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, V]:
+        return {
+            key: self._deserialize(loads(value))
+            for key, value in self._get_items(keys).items()
+        }
 
     def __repr__(self):
+        self.flush()
         now = time.time()
-        res = aws_json(
-            "dynamodb",
-            "scan",
-            f"--table-name={self.table}",
-            "--consistent-read",
+        res = aws_dynamodb(
+            "Scan",
+            {"TableName": self.table, "ConsistentRead": True},
         )
         items = {}
         if res and "Items" in res:
@@ -200,12 +374,14 @@ class StorageFactory:
         *,
         ttl: float,
         name: str,
+        cache_ttl: float | None = None,
     ) -> MemoryDict[V] | SharedDict[V]:
         if self.dynamodb_table_prefix is not None:
             return SharedDict[V](
                 value_type,
                 ttl=ttl,
                 table=f"{self.dynamodb_table_prefix}-{name}",
+                cache_ttl=cache_ttl,
             )
         else:
             return MemoryDict[V](ttl=ttl)
@@ -1,28 +1,72 @@
+import datetime
 from api_aws import (
+    AwsCredentials,
+    MetricDatum,
     aws_autoscaling_describe_auto_scaling_group,
+    aws_autoscaling_describe_auto_scaling_groups,
     aws_autoscaling_terminate_instance,
     aws_region,
     aws_cloudwatch_put_metric_data,
     aws_autoscaling_increment_desired_capacity,
+    aws_sigv4_sign,
 )
 from unittest import TestCase
 
 
 class Test(TestCase):
+    def test_aws_sigv4_sign(self):
+        # The example from AWS Signature Version 4 documentation.
+        headers = aws_sigv4_sign(
+            method="GET",
+            url="https://iam.amazonaws.com/?Action=ListUsers&Version=2010-05-08",
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded; charset=utf-8"
+            },
+            body=b"",
+            region="us-east-1",
+            service="iam",
+            credentials=AwsCredentials(
+                access_key_id="AKIDEXAMPLE",
+                secret_access_key="wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+            ),
+            now=datetime.datetime(2015, 8, 30, 12, 36, 0),
+        )
+        self.assertEqual(
+            headers["Authorization"],
+            "AWS4-HMAC-SHA256 "
+            + "Credential=AKIDEXAMPLE/20150830/us-east-1/iam/aws4_request, "
+            + "SignedHeaders=content-type;host;x-amz-date, "
+            + "Signature=5d672d79c15b13162d9279b0855cfba6789a8edb4c82c400e06b5924a6f2b5d7",
+        )
+
     def test_aws_region(self):
         self.assertIsNone(aws_region())
 
     def test_aws_cloudwatch_put_metric_data(self):
         self.assertIsNone(
             aws_cloudwatch_put_metric_data(
-                metrics={"Test": 42},
-                dimensions={"Test": "Test"},
+                data=[
+                    MetricDatum(
+                        name="Test",
+                        dimensions={"Test": "Test"},
+                        timestamp=0,
+                        count=1,
+                        sum=42,
+                        min=42,
+                        max=42,
+                    )
+                ],
             )
         )
 
     def test_aws_autoscaling_describe_auto_scaling_group(self):
         self.assertIsNone(aws_autoscaling_describe_auto_scaling_group(asg_name="test"))
 
+    def test_aws_autoscaling_describe_auto_scaling_groups(self):
+        self.assertIsNone(
+            aws_autoscaling_describe_auto_scaling_groups(asg_names=["a", "b"])
+        )
+
     def test_aws_autoscaling_increment_desired_capacity(self):
         self.assertIsNone(
             aws_autoscaling_increment_desired_capacity(asg_name="test", inc=1)
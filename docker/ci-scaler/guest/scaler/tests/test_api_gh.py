@@ -1,14 +1,23 @@
+import hashlib
+import http.client
 from api_gh import (
+    GhApiClient,
+    GhApiError,
+    gh_api,
+    gh_auth_token,
+    gh_api_pages,
     gh_fetch_rate_limits,
     gh_fetch_runners,
     gh_fetch_workflow,
     gh_get_webhook_secret,
     gh_predict_workflow_labels,
     gh_runner_ensure_absent,
+    gh_token,
     gh_webhook_ensure_absent,
     gh,
 )
-from unittest import TestCase
+from typing import Any
+from unittest import TestCase, mock
 
 
 class Test(TestCase):
@@ -90,3 +99,135 @@ class Test(TestCase):
             ),
             {"lab1": 1, "lab2": 2, "lab4": 2, "lab5": 4, "aaa": 2, "bbb": 1},
         )
+
+
+class StubConnection:
+    def __init__(
+        self,
+        *,
+        responses: list[tuple[int, dict[str, str], bytes] | Exception],
+    ):
+        self.responses = responses
+        self.requests: list[tuple[str, str, dict[str, str]]] = []
+        self.closed = False
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        body: bytes | None,
+        headers: dict[str, str],
+    ) -> None:
+        self.requests.append((method, path, headers))
+
+    def getresponse(self) -> Any:
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        status, headers, body = response
+        message = http.client.HTTPMessage()
+        for name, value in headers.items():
+            message[name] = value
+        return mock.Mock(
+            status=status,
+            headers=message,
+            will_close=False,
+            read=lambda: body,
+        )
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class TestGhApiClient(TestCase):
+    def setUp(self):
+        self.client = GhApiClient(
+            url="https://api.example.com/api/v3",
+            token="token",
+            pool_size=2,
+        )
+        self.connections: list[StubConnection] = []
+        self.responses: list[tuple[int, dict[str, str], bytes] | Exception] = []
+
+        def connect() -> StubConnection:
+            connection = StubConnection(responses=self.responses)
+            self.connections.append(connection)
+            return connection
+
+        self.client.pool._connect = connect  # type: ignore
+        patcher = mock.patch("api_gh.gh_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_follow_link_header(self):
+        self.responses.extend(
+            [
+                (
+                    200,
+                    {
+                        "Link": '<https://api.example.com/api/v3/repos/o/r/actions/runners?per_page=1&page=2>; rel="next", '
+                        + '<https://api.example.com/api/v3/repos/o/r/actions/runners?per_page=1&page=2>; rel="last"'
+                    },
+                    b'{"page": 1}',
+                ),
+                (200, {}, b'{"page": 2}'),
+            ]
+        )
+        pages = gh_api_pages("repos/o/r/actions/runners?per_page=1")
+        self.assertEqual(pages, [{"page": 1}, {"page": 2}])
+        # Both requests reuse one keep-alive connection.
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(
+            [path for _, path, _ in self.connections[0].requests],
+            [
+                "/api/v3/repos/o/r/actions/runners?per_page=1",
+                "/api/v3/repos/o/r/actions/runners?per_page=1&page=2",
+            ],
+        )
+        self.assertEqual(
+            self.connections[0].requests[0][2]["Authorization"],
+            "Bearer token",
+        )
+
+    def test_error_status_raises_gh_api_error(self):
+        self.responses.append((404, {}, b'{"message": "Not Found"}'))
+        with self.assertRaises(GhApiError) as cm:
+            gh_api("repos/o/r/hooks/42", method="DELETE")
+        self.assertEqual(cm.exception.status, 404)
+        self.assertEqual(cm.exception.returncode, 1)
+        self.assertEqual(cm.exception.stdout, '{"message": "Not Found"}')
+        self.assertEqual(cm.exception.stderr, "gh: Not Found (HTTP 404)")
+        # The connection is still good to reuse after an error status.
+        self.assertEqual(self.client.pool._idle, [self.connections[0]])
+
+    def test_retries_on_stale_keep_alive_connection(self):
+        self.responses.extend(
+            [
+                (200, {}, b"{}"),
+                http.client.RemoteDisconnected("closed"),
+                (200, {}, b'{"ok": true}'),
+            ]
+        )
+        gh_api("rate_limit")
+        self.assertEqual(gh_api("rate_limit"), {"ok": True})
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(self.connections[0].closed)
+
+    def test_does_not_retry_on_fresh_connection(self):
+        self.responses.append(http.client.RemoteDisconnected("closed"))
+        with self.assertRaises(http.client.RemoteDisconnected):
+            gh_api("rate_limit")
+        self.assertEqual(len(self.connections), 1)
+
+    def test_webhook_secret_is_derived_from_unstripped_gh_token(self):
+        gh_auth_token.cache_clear()
+        self.addCleanup(gh_auth_token.cache_clear)
+        with mock.patch.dict("os.environ", clear=True), mock.patch(
+            "api_gh.gh", return_value="token\n"
+        ):
+            self.assertEqual(gh_token(), "token")
+            self.assertEqual(
+                gh_get_webhook_secret(),
+                hashlib.sha256(b"token\n").digest().hex(),
+            )
@@ -0,0 +1,179 @@
+import threading
+import time
+from handler_webhooks import AsgIncrement, AsgIncrementAggregator, HandlerWebhooks
+from helpers import AsgSpec, KeyedWorkQueue
+from metrics import MetricsBuffer
+from storage import StorageFactory
+from typing import Any
+from unittest import TestCase
+from unittest.mock import patch
+
+
+class StubRequestHandler:
+    def __init__(self):
+        self.sent: list[tuple[int, Any]] = []
+
+    def send_json(self, status: int, *, json: Any = None, message: str | None = None):
+        self.sent.append((status, json or message))
+
+    def send_error(self, code: int, message: str | None = None):
+        self.sent.append((code, message))
+
+
+#
+# Collects the started timers instead of running them, so a test decides when
+# a window ends.
+#
+class FakeTimers:
+    def __init__(self):
+        self.started: list[Any] = []
+
+    def __call__(self, interval: float, function: Any) -> Any:
+        timers = self
+
+        class FakeTimer:
+            daemon = False
+
+            def start(self):
+                timers.started.append(function)
+
+        return FakeTimer()
+
+    def fire(self) -> None:
+        self.started.pop(0)()
+
+
+class Test(TestCase):
+    def setUp(self):
+        with patch("handler_webhooks.gh_get_webhook_secret", return_value="secret"):
+            self.webhooks = HandlerWebhooks(
+                domain="example.com",
+                asg_specs=[AsgSpec("o/r:label:asg")],
+                storage=StorageFactory(),
+                metrics=MetricsBuffer(),
+                increment_window_sec=0.1,
+            )
+        patcher = patch("handler_webhooks.log")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, event_key: str, work: Any) -> tuple[int, Any]:
+        handler = StubRequestHandler()
+        self.webhooks._enqueue(
+            handler=handler,  # type: ignore
+            repository="o/r",
+            event_key=event_key,
+            work=work,
+        )
+        return handler.sent[0]
+
+    def wait_processed(self):
+        for _ in range(500):
+            if not self.webhooks.work_queue.depth:
+                return
+            time.sleep(0.01)
+        self.fail("work queue is not drained")
+
+    def test_enqueue_acknowledges_and_dedups(self):
+        processed: list[str] = []
+        status, json = self.enqueue("1:1", lambda: processed.append("1:1") or "ok")
+        self.assertEqual(status, 202)
+        self.assertEqual(json["message"], "queued")
+        self.wait_processed()
+        self.assertEqual(processed, ["1:1"])
+
+        status, message = self.enqueue("1:1", lambda: processed.append("1:1") or "ok")
+        self.assertEqual(status, 202)
+        self.assertIn("already been processed", message)
+        self.wait_processed()
+        self.assertEqual(processed, ["1:1"])
+
+    def test_enqueue_forgets_failed_event(self):
+        def fail() -> str:
+            raise ValueError("failed")
+
+        with patch("helpers.log"):
+            self.enqueue("1:1", fail)
+            self.wait_processed()
+        self.assertNotIn("1:1", self.webhooks.duplicated_events)
+        # A redelivery of the event is processed again.
+        status, json = self.enqueue("1:1", lambda: "ok")
+        self.assertEqual((status, json["message"]), (202, "queued"))
+        self.wait_processed()
+        self.assertIn("1:1", self.webhooks.duplicated_events)
+
+    def test_enqueue_rejects_when_queue_is_full(self):
+        self.webhooks.work_queue = KeyedWorkQueue(name="test", workers=1, max_depth=1)
+        release = threading.Event()
+        self.enqueue("1:1", lambda: release.wait() and "ok")
+        status, message = self.enqueue("2:1", lambda: "ok")
+        self.assertEqual(status, 503)
+        self.assertIn("work queue is full", message)
+        self.assertNotIn("2:1", self.webhooks.duplicated_events)
+        release.set()
+        self.wait_processed()
+
+    def test_asg_increments_are_merged_within_window(self):
+        timers = FakeTimers()
+        calls: list[tuple[str, int]] = []
+
+        def increment(*, asg_name: str, inc: int) -> int:
+            calls.append((asg_name, inc))
+            return 10 + inc
+
+        with (
+            patch("threading.Timer", timers),
+            patch(
+                "handler_webhooks.aws_autoscaling_increment_desired_capacity",
+                increment,
+            ),
+        ):
+            aggregator = AsgIncrementAggregator(window_sec=0.3)
+            future1 = aggregator.increment({"a": 1})
+            future2 = aggregator.increment({"a": 2, "b": 1})
+            self.assertEqual(len(timers.started), 1)
+            self.assertFalse(future1.done() or future2.done())
+
+            timers.fire()
+            self.assertEqual(sorted(calls), [("a", 3), ("b", 1)])
+            self.assertEqual(
+                future1.result(),
+                {"a": AsgIncrement(inc=3, events=2, desired_capacity=13)},
+            )
+            self.assertEqual(
+                future2.result(),
+                {
+                    "a": AsgIncrement(inc=3, events=2, desired_capacity=13),
+                    "b": AsgIncrement(inc=1, events=1, desired_capacity=11),
+                },
+            )
+
+            # The next increment opens a new window.
+            future3 = aggregator.increment({"b": 5})
+            self.assertEqual(len(timers.started), 1)
+            timers.fire()
+            self.assertEqual(calls[-1], ("b", 5))
+            self.assertEqual(future3.result()["b"].desired_capacity, 15)
+
+    def test_asg_increment_failure_fails_its_requesters_only(self):
+        timers = FakeTimers()
+
+        def increment(*, asg_name: str, inc: int) -> int:
+            if asg_name == "b":
+                raise ValueError("throttled")
+            return inc
+
+        with (
+            patch("threading.Timer", timers),
+            patch(
+                "handler_webhooks.aws_autoscaling_increment_desired_capacity",
+                increment,
+            ),
+        ):
+            aggregator = AsgIncrementAggregator(window_sec=0.3)
+            future1 = aggregator.increment({"a": 1})
+            future2 = aggregator.increment({"a": 1, "b": 1})
+            timers.fire()
+            self.assertEqual(future1.result()["a"].desired_capacity, 2)
+            with self.assertRaisesRegex(ValueError, "throttled"):
+                future2.result()
@@ -0,0 +1,101 @@
+import threading
+import time
+from helpers import (
+    AsgDescription,
+    AsgSpec,
+    KeyedWorkQueue,
+    Runner,
+    RunnersIndex,
+)
+from unittest import TestCase
+
+
+class Test(TestCase):
+    def test_keyed_work_queue_keeps_order_per_key(self):
+        work_queue = KeyedWorkQueue(name="test", workers=4, max_depth=100)
+        done: dict[str, list[int]] = {"a": [], "b": []}
+        finished = threading.Semaphore(0)
+
+        def work(key: str, i: int):
+            time.sleep(0.001 * ((i * 7) % 5))
+            done[key].append(i)
+            finished.release()
+
+        for i in range(20):
+            for key in done:
+                self.assertTrue(
+                    work_queue.submit(key=key, work=lambda k=key, i=i: work(k, i))
+                )
+        for _ in range(40):
+            finished.acquire()
+        self.assertEqual(done, {"a": list(range(20)), "b": list(range(20))})
+
+    def test_keyed_work_queue_max_depth(self):
+        work_queue = KeyedWorkQueue(name="test", workers=1, max_depth=2)
+        release = threading.Event()
+        self.assertTrue(work_queue.submit(key="a", work=release.wait))
+        self.assertTrue(work_queue.submit(key="a", work=lambda: None))
+        self.assertFalse(work_queue.submit(key="b", work=lambda: None))
+        self.assertEqual(work_queue.depth, 2)
+        release.set()
+
+    def test_runners_index(self):
+        runner = Runner(
+            id="1",
+            name="ci-storage-1",
+            status="online",
+            busy=False,
+            labels=["a", "b"],
+            loaded_at=0,
+        )
+        index = RunnersIndex()
+        index.add(runner, repositories=["o/r1", "o/r2"])
+        spec1 = AsgSpec("o/r1:a:asg1")
+        spec2 = AsgSpec("o/r2:b:asg2")
+        spec3 = AsgSpec("o/r3:a:asg3")
+        assigned = index.assign(asg_specs=[spec1, spec2, spec3], asg_descriptions=None)
+        self.assertEqual(assigned, {spec1: [runner], spec2: [runner], spec3: []})
+
+    def test_runners_index_org_runner_shared_by_repositories(self):
+        def runner(id: str, instance: str) -> Runner:
+            return Runner(
+                id=id,
+                name=f"ci-storage-{instance}",
+                status="online",
+                busy=False,
+                labels=["linux"],
+                loaded_at=0,
+                org="o",
+            )
+
+        def asg(*instance_ids: str) -> AsgDescription:
+            return AsgDescription(
+                desired_capacity=len(instance_ids),
+                min_size=0,
+                max_size=10,
+                instance_ids=list(instance_ids),
+            )
+
+        in1, in2, orphan = runner("1", "in1"), runner("2", "in2"), runner("3", "gone")
+        index = RunnersIndex()
+        for r in [in1, in2, orphan]:
+            index.add(r, repositories=["o/r1", "o/r2"])
+        spec1, spec2 = AsgSpec("o/r1:linux:asg1"), AsgSpec("o/r2:linux:asg2")
+        asg_descriptions = {"asg1": asg("i-in1"), "asg2": asg("i-in2")}
+        self.assertEqual(
+            index.assign(asg_specs=[spec1, spec2], asg_descriptions=asg_descriptions),
+            {spec1: [in1, orphan], spec2: [in2]},
+        )
+        self.assertEqual(
+            index.assign(asg_specs=[spec2, spec1], asg_descriptions=asg_descriptions),
+            {spec1: [in1], spec2: [in2, orphan]},
+        )
+        self.assertEqual(
+            index.assign(asg_specs=[spec1, spec2], asg_descriptions=None),
+            {spec1: [in1, in2, orphan], spec2: []},
+        )
+        spec3 = AsgSpec("o/r2:linux:asg1")
+        self.assertEqual(
+            index.assign(asg_specs=[spec1, spec3], asg_descriptions=asg_descriptions),
+            {spec1: [in1, in2, orphan], spec3: []},
+        )
@@ -0,0 +1,81 @@
+from api_aws import MetricDatum
+from metrics import MetricsBuffer
+from unittest import TestCase
+from unittest.mock import patch
+
+
+class Test(TestCase):
+    def test_metrics_buffer_aggregates_statistic_sets(self):
+        published: list[list[MetricDatum]] = []
+        with patch("metrics.aws_region", return_value="us-east-1"), patch(
+            "metrics.aws_cloudwatch_put_metric_data",
+            side_effect=lambda *, data: published.append(data),
+        ):
+            buffer = MetricsBuffer(flush_interval_sec=3600, max_data=2)
+            for value in [5, 1, 9]:
+                self.assertTrue(
+                    buffer.add(metrics={"Time": value}, dimensions={"L": "a"})
+                )
+            buffer.add(metrics={"Time": 3}, dimensions={"L": "b"})
+            buffer.add(metrics={"Count": 7}, dimensions={})
+            buffer.flush()
+        self.assertEqual([len(data) for data in published], [2, 1])
+        by_key = {
+            (datum.name, tuple(datum.dimensions.values())): datum
+            for data in published
+            for datum in data
+        }
+        a = by_key[("Time", ("a",))]
+        self.assertEqual((a.count, a.sum, a.min, a.max), (3, 15, 1, 9))
+        self.assertEqual(by_key[("Time", ("b",))].count, 1)
+        self.assertEqual(by_key[("Count", ())].sum, 7)
+
+    def test_metrics_buffer_keeps_data_on_failure(self):
+        with patch("metrics.aws_region", return_value="us-east-1"), patch(
+            "metrics.aws_cloudwatch_put_metric_data",
+            side_effect=ValueError("boom"),
+        ):
+            buffer = MetricsBuffer(flush_interval_sec=3600)
+            buffer.add(metrics={"Time": 1}, dimensions={})
+            with self.assertRaises(ValueError):
+                buffer.flush()
+            buffer.add(metrics={"Time": 2}, dimensions={})
+        published: list[list[MetricDatum]] = []
+        with patch(
+            "metrics.aws_cloudwatch_put_metric_data",
+            side_effect=lambda *, data: published.append(data),
+        ):
+            buffer.flush()
+        self.assertEqual(published[0][0].count, 2)
+
+    def test_metrics_buffer_keeps_only_failed_chunks(self):
+        published: list[list[MetricDatum]] = []
+
+        def put_metric_data(*, data: list[MetricDatum]):
+            if any(datum.name == "Fail" for datum in data):
+                raise ValueError("boom")
+            published.append(data)
+
+        with patch("metrics.aws_region", return_value="us-east-1"), patch(
+            "metrics.aws_cloudwatch_put_metric_data",
+            side_effect=put_metric_data,
+        ):
+            buffer = MetricsBuffer(flush_interval_sec=3600, max_data=1)
+            buffer.add(metrics={"Ok": 1, "Fail": 2}, dimensions={})
+            with self.assertRaises(ValueError):
+                buffer.flush()
+        self.assertEqual([data[0].name for data in published], ["Ok"])
+        published.clear()
+        with patch(
+            "metrics.aws_cloudwatch_put_metric_data",
+            side_effect=lambda *, data: published.append(data),
+        ):
+            buffer.flush()
+        # The published chunk is not published again.
+        self.assertEqual([data[0].name for data in published], ["Fail"])
+        self.assertEqual(published[0][0].count, 1)
+
+    def test_metrics_buffer_dry_run(self):
+        with patch("metrics.aws_region", return_value=None):
+            buffer = MetricsBuffer()
+            self.assertIsNone(buffer.add(metrics={"Time": 1}, dimensions={}))
@@ -0,0 +1,140 @@
+from api_aws import AwsError
+from storage import SHARED_DICT_FLUSH_MAX_FAILURES, MemoryDict, SharedDict
+from typing import Any
+from unittest import TestCase
+from unittest.mock import patch
+
+
+#
+# An in-memory stand-in for the DynamoDB table behind SharedDict. Items with
+# pk="bad" are rejected, like DynamoDB rejects invalid items.
+#
+class FakeDynamoDb:
+    def __init__(self):
+        self.items: dict[str, dict[str, Any]] = {}
+        self.calls: list[str] = []
+
+    def __call__(self, action: str, params: dict[str, Any]) -> Any:
+        self.calls.append(action)
+        if action == "DescribeTable":
+            return {"Table": {"TableStatus": "ACTIVE"}}
+        elif action == "BatchGetItem":
+            keys = params["RequestItems"]["t"]["Keys"]
+            return {
+                "Responses": {
+                    "t": [
+                        self.items[key["pk"]["S"]]
+                        for key in keys
+                        if key["pk"]["S"] in self.items
+                    ]
+                }
+            }
+        elif action == "BatchWriteItem":
+            requests = params["RequestItems"]["t"]
+            for request in requests:
+                if "PutRequest" in request:
+                    item = request["PutRequest"]["Item"]
+                    if item["pk"]["S"] == "bad":
+                        raise AwsError(
+                            service="dynamodb",
+                            action=action,
+                            status=400,
+                            code="ValidationException",
+                            message="invalid item",
+                        )
+            for request in requests:
+                if "PutRequest" in request:
+                    item = request["PutRequest"]["Item"]
+                    self.items[item["pk"]["S"]] = item
+                else:
+                    self.items.pop(request["DeleteRequest"]["Key"]["pk"]["S"], None)
+            return {}
+        raise ValueError(f"unexpected action {action}")
+
+    def put(self, key: str, value: str) -> None:
+        self.items[key] = {**self.items[key], "val": {"S": value}}
+
+
+class Test(TestCase):
+    def test_memory_dict_expires_keys(self):
+        with patch("time.time", return_value=1000):
+            d = MemoryDict[int](ttl=10)
+            d["a"] = 1
+        with patch("time.time", return_value=1005):
+            d["b"] = 2
+            self.assertEqual(d["a"], 1)
+        with patch("time.time", return_value=1011):
+            self.assertNotIn("a", d)
+            self.assertIsNone(d.get("a"))
+            self.assertEqual(d.get_many(["a", "b"]), {"b": 2})
+            with self.assertRaises(KeyError):
+                d["a"]
+
+    def test_memory_dict_rewrite_extends_ttl(self):
+        with patch("time.time", return_value=1000):
+            d = MemoryDict[int](ttl=10)
+            d["a"] = 1
+            d["b"] = 2
+        with patch("time.time", return_value=1005):
+            d["a"] = 3
+        with patch("time.time", return_value=1012):
+            d["c"] = 4
+            self.assertEqual(repr(d), "MemoryDict({'a': 3, 'c': 4})")
+
+    def test_memory_dict_max_size(self):
+        d = MemoryDict[int](ttl=10, max_size=2)
+        d["a"] = 1
+        d["b"] = 2
+        d["a"] = 3
+        d["c"] = 4
+        self.assertEqual(repr(d), "MemoryDict({'a': 3, 'c': 4})")
+        del d["a"]
+        self.assertNotIn("a", d)
+
+    def test_shared_dict_caches_found_items_briefly(self):
+        dynamodb = FakeDynamoDb()
+        with patch("storage.aws_dynamodb", dynamodb):
+            with patch("time.time", return_value=1000):
+                d = SharedDict(int, ttl=3600, table="t")
+                d["a"] = 1
+                d.flush()
+                # Another instance changes the item.
+                dynamodb.put("a", "2")
+                self.assertEqual(d["a"], 1)
+            with patch("time.time", return_value=1010):
+                self.assertEqual(d["a"], 2)
+
+    def test_shared_dict_without_cache_reads_fresh(self):
+        dynamodb = FakeDynamoDb()
+        with patch("storage.aws_dynamodb", dynamodb):
+            d = SharedDict(int, ttl=3600, table="t", cache_ttl=0)
+            d["a"] = 1
+            d.flush()
+            self.assertIn("a", d)
+            # Another instance deletes the item.
+            del dynamodb.items["a"]
+            self.assertNotIn("a", d)
+
+    def test_shared_dict_drops_rejected_item(self):
+        dynamodb = FakeDynamoDb()
+        with patch("storage.aws_dynamodb", dynamodb), patch("storage.log"):
+            d = SharedDict(int, ttl=3600, table="t")
+            d["good1"] = 1
+            d["bad"] = 2
+            d["good2"] = 3
+            with self.assertRaises(AwsError):
+                d.flush()
+            self.assertEqual(dynamodb.items, {})
+            # The rejected item is now written alone, so it doesn't hold back
+            # the others anymore.
+            with self.assertRaises(AwsError):
+                d.flush()
+            self.assertEqual(sorted(dynamodb.items), ["good1", "good2"])
+            for _ in range(SHARED_DICT_FLUSH_MAX_FAILURES - 3):
+                with self.assertRaises(AwsError):
+                    d.flush()
+            d.flush()
+            self.assertNotIn("bad", d)
+            dynamodb.calls.clear()
+            d.flush()
+            self.assertEqual(dynamodb.calls, [])
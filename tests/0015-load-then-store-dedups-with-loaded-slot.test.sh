@@ -20,7 +20,9 @@ ci-storage \
 grep -qF 'Checking slot-id="myslot1-early"... found in the storage, using it' "$OUT"
 
 # ...we should use the same myslot1-early as a value for --link-dest as well
-# (NOT the most recent slot myslot2-middle).
+# (NOT the most recent slot myslot2-middle). We add a new file, otherwise the
+# directory would be unchanged, and the slot would be stored as an alias.
+touch "$LOCAL_DIR/file-new-3"
 ci-storage \
   --slot-id="myslot3-late" \
   store
@@ -38,6 +40,7 @@ ci-storage \
   load
 grep -qF 'Checking slot-id="*"... loading the most recent full (non-layer) slot-id="myslot3-late"' "$OUT"
 
+touch "$LOCAL_DIR/file-new-4"
 ci-storage \
   --slot-id="myslot4-end" \
   store
@@ -7,6 +7,7 @@ ci-storage \
 
 sleep 1
 
+touch "$LOCAL_DIR/file-new-2"
 ci-storage \
   --slot-id=myslot2 \
   store
@@ -15,6 +16,7 @@ test -f "$STORAGE_DIR/myslot1/file-1"
 
 sleep 2
 
+touch "$LOCAL_DIR/file-new-3"
 ci-storage \
   --slot-id=myslot3 \
   --storage-max-age-sec=1 \
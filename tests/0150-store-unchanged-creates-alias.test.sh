@@ -0,0 +1,48 @@
+#!/bin/bash
+source ./common.sh
+
+ci-storage \
+  --slot-id=myslot1 \
+  store
+
+ci-storage \
+  --slot-id=myslot1 \
+  load
+
+ci-storage \
+  --slot-id=myslot2 \
+  --hint="aaa" \
+  store
+
+# Nothing changed since load, so myslot2 must be an alias of myslot1.
+grep -qF 'Local directory is unchanged since slot-id="myslot1", so storing slot-id="myslot2" as an alias of slot-id="myslot1"' "$OUT"
+grep -qE 'alias=myslot1$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+grep -qE 'hints=aaa$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+test ! -e "$STORAGE_DIR/myslot2/file-1"
+
+# An alias of an alias refers to the original slot.
+ci-storage \
+  --slot-id=myslot3 \
+  store
+
+grep -qE 'alias=myslot1$' "$STORAGE_DIR/myslot3/.ci-storage.meta"
+
+# Loading from an alias loads the files of the original slot.
+rm "$LOCAL_DIR/file-1"
+ci-storage \
+  --slot-id=myslot3 \
+  load
+
+grep -qF 'Slot-id="myslot3" is an alias of slot-id="myslot1"' "$OUT"
+test -f "$LOCAL_DIR/file-1"
+
+# Once something changes, we store the files again, deduplicating them with the
+# original slot.
+touch "$LOCAL_DIR/file-new"
+ci-storage \
+  --slot-id=myslot4 \
+  store
+
+grep -qF -- '--link-dest=../myslot1/' "$OUT"
+test -f "$STORAGE_DIR/myslot4/file-new"
+test "$(hardlink-count "$STORAGE_DIR/myslot4/file-1")" == 2
@@ -0,0 +1,39 @@
+#!/bin/bash
+source ./common.sh
+
+echo "old" > "$LOCAL_DIR/file-1"
+ci-storage \
+  --slot-id=myslot1 \
+  store
+
+ci-storage \
+  --slot-id=myslot2 \
+  --hint="aaa" \
+  store
+
+ci-storage \
+  --slot-id=myslot3 \
+  store
+
+grep -qE 'alias=myslot1$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+grep -qE 'alias=myslot1$' "$STORAGE_DIR/myslot3/.ci-storage.meta"
+
+# Storing myslot1 again (e.g. on a job re-run) must not change the content of
+# the slots which are aliases of it: the old content moves to one of them.
+echo "new" > "$LOCAL_DIR/file-1"
+ci-storage \
+  --slot-id=myslot1 \
+  store
+
+grep -qF 'moved the previous content' "$OUT"
+test "$(cat "$STORAGE_DIR/myslot1/file-1")" == "new"
+test "$(cat "$STORAGE_DIR/myslot3/file-1")" == "old"
+test "$(grep -c '^alias=' "$STORAGE_DIR/myslot3/.ci-storage.meta")" == 0
+grep -qE 'alias=myslot3$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+grep -qE 'hints=aaa$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+
+ci-storage \
+  --slot-id=myslot2 \
+  load
+
+test "$(cat "$LOCAL_DIR/file-1")" == "old"
@@ -0,0 +1,32 @@
+#!/bin/bash
+source ./common.sh
+
+ci-storage \
+  --slot-id=myslot1 \
+  --local-backend=native \
+  store
+
+grep -qF "natively" "$OUT"
+test -f "$STORAGE_DIR/myslot1/file-1"
+test -f "$STORAGE_DIR/myslot1/dir-a/file-a-1"
+
+touch "$LOCAL_DIR/file-new"
+ci-storage \
+  --slot-id=myslot2 \
+  --local-backend=native \
+  store
+
+grep -qF "(link-dest: $STORAGE_DIR/myslot1/)" "$OUT"
+test "$(hardlink-count "$STORAGE_DIR/myslot2/file-1")" == 2
+test "$(hardlink-count "$STORAGE_DIR/myslot2/file-new")" == 1
+
+rm -rf "$LOCAL_DIR/dir-a"
+touch "$LOCAL_DIR/file-extra"
+ci-storage \
+  --slot-id=myslot2 \
+  --local-backend=native \
+  load
+
+test -f "$LOCAL_DIR/dir-a/file-a-1"
+test -f "$LOCAL_DIR/file-new"
+test ! -e "$LOCAL_DIR/file-extra"
@@ -0,0 +1,35 @@
+#!/bin/bash
+source ./common.sh
+
+unset GITHUB_BASE_REF GITHUB_EVENT_PATH
+
+git-commit() {
+  { set +o xtrace; } 2>/dev/null
+  touch "$LOCAL_DIR/file-$1"
+  git -C "$LOCAL_DIR" add -A
+  git -C "$LOCAL_DIR" -c user.name=test -c user.email=test@example.com commit -qm "$1"
+  { set -o xtrace; } 2>/dev/null
+}
+
+git -C "$LOCAL_DIR" init -q
+git-commit a
+ci-storage \
+  --slot-id=myslot-a \
+  store
+
+grep -qE 'Derived 1 hint\(s\) from the git repository' "$OUT"
+
+git-commit b
+ci-storage \
+  --slot-id=myslot-b \
+  store
+
+git -C "$LOCAL_DIR" checkout -q HEAD~1
+git-commit c
+ci-storage \
+  --slot-id="*" \
+  load
+
+grep -qE 'Derived 2 hint\(s\) from the git repository' "$OUT"
+grep -qF 'Winner: slot-id="myslot-a"' "$OUT"
+test ! -e "$LOCAL_DIR/file-b"
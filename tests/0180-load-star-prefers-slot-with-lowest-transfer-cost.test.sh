@@ -0,0 +1,28 @@
+#!/bin/bash
+source ./common.sh
+
+mkdir "$LOCAL_DIR/big"
+for i in $(seq 1 20); do truncate -s 1M "$LOCAL_DIR/big/file-$i"; done
+ci-storage \
+  --slot-id=myslot1 \
+  store
+
+mv "$LOCAL_DIR/big" "$LOCAL_DIR/../big-saved"
+mkdir "$LOCAL_DIR/big"
+for i in $(seq 1 20); do truncate -s 2M "$LOCAL_DIR/big/file-$i"; done
+ci-storage \
+  --slot-id=myslot2 \
+  store
+
+grep -qE '^sketch=[0-9]+ [0-9]+ [0-9a-f]{16}' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+
+rm -rf "$LOCAL_DIR/big"
+mv "$LOCAL_DIR/../big-saved" "$LOCAL_DIR/big"
+rm "$LOCAL_DIR/big/file-20"
+ci-storage \
+  --slot-id="*" \
+  load
+
+grep -qF 'Slots with the lowest estimated transfer cost: myslot1' "$OUT"
+grep -qF 'loading the most recent full (non-layer) slot-id="myslot1"' "$OUT"
+test -e "$LOCAL_DIR/big/file-20"
@@ -0,0 +1,29 @@
+#!/bin/bash
+source ./common.sh
+
+mkdir "$LOCAL_DIR/dir-b"
+touch "$LOCAL_DIR/dir-b/file-b-1"
+ci-storage \
+  --slot-id=myslot \
+  store
+
+rm -rf "${LOCAL_DIR:?}"/*
+ci-storage \
+  --slot-id=myslot \
+  --priority="dir-b/***" \
+  --ready-file="$LOCAL_DIR.ready" \
+  load
+
+sed -n '/Loading the priority files/,/Loading the remaining files/p' "$OUT" | grep -qF "Created ready file $LOCAL_DIR.ready"
+test -e "$LOCAL_DIR.ready"
+test -e "$LOCAL_DIR/dir-b/file-b-1"
+test -e "$LOCAL_DIR/dir-a/file-a-1"
+
+# Jobs may have changed the priority files while the remaining ones were being
+# loaded, so the loaded digest is not remembered, and the next store uploads.
+test "$(grep -c '^digest=' "$LOCAL_META_FILE")" == 0
+ci-storage \
+  --slot-id=myslot2 \
+  store
+
+test "$(grep -c 'as an alias of' "$OUT")" == 0
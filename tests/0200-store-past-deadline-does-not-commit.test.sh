@@ -0,0 +1,11 @@
+#!/bin/bash
+source ./common.sh
+
+ci-storage \
+  --slot-id=myslot \
+  --deadline-sec=0 \
+  store || error=$?
+
+test "$error" == 1
+grep -qF 'Error: deadline exceeded' "$OUT"
+test ! -e "$STORAGE_DIR/myslot"
@@ -0,0 +1,34 @@
+#!/bin/bash
+source ./common.sh
+
+ci-storage \
+  --slot-id=myslot1 \
+  --hint="aaa" \
+  store
+
+grep -qE '^fingerprint=[0-9a-f]+$' "$STORAGE_DIR/myslot1/.ci-storage.meta"
+test -z "$(ls -A "$STORAGE_DIR/.ci-storage.inflight")"
+
+# Another job produced the same tree independently (e.g. a sibling shard of a
+# matrix workflow), so mtimes differ, but the content fingerprint is the same.
+rm "$LOCAL_META_FILE"
+touch -d "2020-01-01" "$LOCAL_DIR/file-1" "$LOCAL_DIR/dir-a/file-a-1"
+ci-storage \
+  --slot-id=myslot2 \
+  --hint="aaa" \
+  store
+
+grep -qF 'Slot-id="myslot1" has the same content, so storing slot-id="myslot2" as an alias of it' "$OUT"
+grep -qE 'alias=myslot1$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+test ! -e "$STORAGE_DIR/myslot2/file-1"
+
+# With different hints, the content is stored as usual.
+rm "$LOCAL_META_FILE"
+ci-storage \
+  --slot-id=myslot3 \
+  --hint="bbb" \
+  store
+
+grep -qF 'claimed the store of content fingerprint' "$OUT"
+test -f "$STORAGE_DIR/myslot3/file-1"
+test -z "$(ls -A "$STORAGE_DIR/.ci-storage.inflight")"
@@ -0,0 +1,35 @@
+#!/bin/bash
+source ./common.sh
+
+local_dir_2=$LOCAL_DIR-2
+local_dir_copy=$LOCAL_DIR-copy
+mkdir -p $local_dir_2
+head -c 300000 /dev/urandom > $local_dir_2/file-slow
+cp -a "$LOCAL_DIR" "$local_dir_copy"
+slug_1=$(realpath -m "$LOCAL_DIR" | tr / _)
+
+# The 2nd directory transfers slowly, so the 1st one has to wait for it before
+# committing, with its in-flight marker claimed long ago.
+../ci-storage \
+  --local-dir="$LOCAL_DIR" \
+  --local-dir="$local_dir_2" \
+  --storage-dir="$STORAGE_DIR" \
+  --slot-id=myslot \
+  --hint=aaa \
+  --bwlimit=100 \
+  store &>$OUT.1 &
+sleep 2
+touch -d "2020-01-01" "$STORAGE_DIR/$slug_1/.ci-storage.inflight/"*
+
+# A job storing the same content still waits for it instead of uploading.
+../ci-storage \
+  --local-dir="$local_dir_copy" \
+  --storage-dir="$STORAGE_DIR/$slug_1" \
+  --slot-id=myslot-copy \
+  --hint=aaa \
+  store &>$OUT
+wait $!
+
+grep -qF 'waiting for in-flight store' "$OUT"
+test "$(grep -c 'looks abandoned' "$OUT")" == 0
+grep -qE 'alias=myslot$' "$STORAGE_DIR/$slug_1/myslot-copy/.ci-storage.meta"
@@ -0,0 +1,30 @@
+#!/bin/bash
+source ./common.sh
+
+ci-storage \
+  --slot-id=myslot1 \
+  --storage-max-age-sec=2 \
+  store
+
+grep -qF 'maintenance is due: no eviction queue yet' "$OUT"
+grep -qE '^[0-9]+ newest myslot1 -$' "$STORAGE_DIR/maintenance.queue"
+
+touch "$LOCAL_DIR/file-new-2"
+ci-storage \
+  --slot-id=myslot2 \
+  --storage-max-age-sec=2 \
+  store
+
+grep -qF 'maintenance is not due, next eviction in' "$OUT"
+test "$(grep -cF '<MAINTENANCE>' "$OUT")" == 0
+
+sleep 3
+
+touch "$LOCAL_DIR/file-new-3"
+ci-storage \
+  --slot-id=myslot3 \
+  --storage-max-age-sec=2 \
+  store
+
+grep -qF 'maintenance is due: slot myslot1 expired' "$OUT"
+grep -qE 'will rename .*myslot1 to myslot1.bak.rm.* and remove' "$OUT"
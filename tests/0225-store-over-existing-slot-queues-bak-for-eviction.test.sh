@@ -0,0 +1,18 @@
+#!/bin/bash
+source ./common.sh
+
+ci-storage \
+  --slot-id=myslot \
+  store
+
+grep -qF 'maintenance is due: no eviction queue yet' "$OUT"
+
+# Re-storing the same slot id moves its previous content to a bak dir, which is
+# evicted by the next maintenance soon, not only at the periodic full rescan.
+touch "$LOCAL_DIR/file-new"
+ci-storage \
+  --slot-id=myslot \
+  store
+
+grep -qE '^[0-9]+ age myslot\.bak\.[0-9]+ -$' "$STORAGE_DIR/maintenance.queue"
+grep -qE 'maintenance is not due, next eviction in (59|60|61)s' "$OUT"
@@ -0,0 +1,37 @@
+#!/bin/bash
+source ./common.sh
+
+export GITHUB_REPOSITORY=owner/repo
+
+ci-storage \
+  --slot-id="*" \
+  load
+
+ci-storage \
+  --slot-id=myslot1 \
+  --hint="aaa" \
+  store
+
+ci-storage \
+  --slot-id="*" \
+  --hint="aaa" \
+  load
+
+ci-storage \
+  --slot-id=myslot2 \
+  store
+
+grep -qE '"action":"load","slot_id":"","reason":"empty"' "$STORAGE_DIR/journal.jsonl"
+grep -qE '"action":"store","slot_id":"myslot1","reason":"upload"' "$STORAGE_DIR/journal.jsonl"
+grep -qE '"action":"load","slot_id":"myslot1","reason":"hint","weight":"1"' "$STORAGE_DIR/journal.jsonl"
+grep -qE '"action":"store","slot_id":"myslot2","reason":"unchanged"' "$STORAGE_DIR/journal.jsonl"
+grep -qE '"namespace":"owner/repo"' "$STORAGE_DIR/journal.jsonl"
+
+ci-storage \
+  --storage-dir="$(dirname "$STORAGE_DIR")" \
+  report
+
+grep -qF "owner/repo in $STORAGE_DIR:" "$OUT"
+grep -qF 'load: 2 op(s), hint hit rate: 100.0% of 1 "*" load(s)' "$OUT"
+grep -qF 'misses: 1' "$OUT"
+grep -qF 'store: 2 op(s), aliased: 50.0%' "$OUT"
@@ -0,0 +1,45 @@
+#!/bin/bash
+source ./common.sh
+
+fake-ssh
+queue_file=/tmp/.ci-storage.journal.fakehost
+
+ci-storage \
+  --storage-host=fakehost \
+  --slot-id=myslot \
+  store
+
+# The record of a "load" is sent in background, even if nothing else is done
+# with the storage host afterwards.
+ci-storage \
+  --storage-host=fakehost \
+  --slot-id=myslot \
+  load
+
+for _ in $(seq 50); do
+  grep -qE '"action":"load","slot_id":"myslot","reason":"exact"' "$STORAGE_DIR/journal.jsonl" && break
+  sleep 0.1
+done
+grep -qE '"action":"load","slot_id":"myslot","reason":"exact"' "$STORAGE_DIR/journal.jsonl"
+test -z "$(ls $queue_file* 2>/dev/null)"
+
+# If the storage host is unreachable, the queued records are kept.
+printf '%s\t%s\n' "$STORAGE_DIR" '{"action":"load","slot_id":"queued"}' > $queue_file
+printf '#!/bin/bash\nexit 255\n' > /tmp/ci-storage/bin/ssh
+ci-storage \
+  --storage-host=fakehost \
+  --slot-id=myslot \
+  store || error=$?
+
+test "$error" != 0
+cat $queue_file* | grep -qF '"slot_id":"queued"'
+
+# And they are sent with the next call.
+fake-ssh
+ci-storage \
+  --storage-host=fakehost \
+  --slot-id=myslot2 \
+  store
+
+grep -qF '"slot_id":"queued"' "$STORAGE_DIR/journal.jsonl"
+test -z "$(ls $queue_file* 2>/dev/null)"
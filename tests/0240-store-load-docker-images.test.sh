@@ -0,0 +1,50 @@
+#!/bin/bash
+source ./common.sh
+
+if ! docker info &>/dev/null; then
+  echo "Docker is not available, skipping"
+  exit 0
+fi
+
+image=ci-storage-test:$$
+build_dir=$(mktemp -d)
+echo "hello" > "$build_dir/hello.txt"
+printf 'FROM scratch\nCOPY hello.txt /\n' > "$build_dir/Dockerfile"
+docker build -q -t "$image" "$build_dir"
+
+ci-storage \
+  --slot-id=myslot1 \
+  --docker-images="$image" \
+  store
+
+test -f "$STORAGE_DIR/myslot1/manifest.json"
+test ! -e "$STORAGE_DIR/myslot1/file-1"
+test "$(find "$STORAGE_DIR/.ci-storage.blobs/blobs" -type f | wc -l)" -gt 0
+
+# Nothing changed, so the slot is stored as an alias.
+ci-storage \
+  --slot-id=myslot2 \
+  --docker-images="$image" \
+  store
+
+grep -qE 'alias=myslot1$' "$STORAGE_DIR/myslot2/.ci-storage.meta"
+
+docker rmi "$image"
+ci-storage \
+  --slot-id=myslot2 \
+  --docker-images="*" \
+  load
+
+grep -qF 'Importing 1 Docker image(s)' "$OUT"
+docker image inspect "$image" >/dev/null
+
+# The daemon already has the image, so it's not imported again.
+ci-storage \
+  --slot-id=myslot2 \
+  --docker-images="*" \
+  load
+
+grep -qF 'already exists' "$OUT"
+
+docker rmi "$image"
+rm -rf "$build_dir"
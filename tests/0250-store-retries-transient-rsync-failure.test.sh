@@ -0,0 +1,34 @@
+#!/bin/bash
+source ./common.sh
+
+# A wrapper which fails the 1st transfer like a dropped connection would do
+# (with some files already uploaded) and remembers the destinations.
+bin_dir=/tmp/ci-storage/bin
+rm -rf $bin_dir
+mkdir -p $bin_dir
+cat >$bin_dir/rsync <<EOT
+#!/bin/bash
+if [[ "\$1" != --version ]]; then
+  echo "\${@: -1}" >>$bin_dir/destinations
+  if [[ ! -e $bin_dir/failed ]]; then
+    touch $bin_dir/failed
+    mkdir -p "\${@: -1}"
+    cp "$LOCAL_DIR/file-1" "\${@: -1}"
+    echo "rsync: connection unexpectedly closed"
+    exit 12
+  fi
+fi
+exec $(command -v rsync) "\$@"
+EOT
+chmod +x $bin_dir/rsync
+
+PATH="$bin_dir:$PATH" ci-storage \
+  --slot-id=myslot \
+  store
+
+grep -qF "exited with code 12, which looks transient, so retrying" "$OUT"
+test "$(wc -l <$bin_dir/destinations)" == 2
+test "$(sort -u $bin_dir/destinations | wc -l)" == 1
+test -f "$STORAGE_DIR/myslot/file-1"
+test -f "$STORAGE_DIR/myslot/dir-a/file-a-1"
+test "$(find "$STORAGE_DIR" -maxdepth 1 -name '*.tmp.*' | wc -l)" == 0
@@ -0,0 +1,32 @@
+#!/bin/bash
+source ./common.sh
+
+file_list=/tmp/ci-storage/file-list.gz
+rm -f $file_list
+
+mkdir -p "$LOCAL_DIR/dir-a/dir-b"
+touch "$LOCAL_DIR/dir-a/dir-b/file-b-1" "$LOCAL_DIR/dir-a/dir-b/file-b-2"
+
+ci-storage \
+  --slot-id=myslot \
+  --verbose \
+  --file-list=$file_list \
+  store
+
+grep -qE '^    dir-a/dir-b/: \+2 ~0 -0$' "$OUT"
+test "$(grep -cF 'file-b-1' "$OUT")" == 0
+gunzip -c $file_list | grep -qE '^\S+ dir-a/dir-b/file-b-1$'
+gunzip -c $file_list | grep -qE '^\S+ file-1$'
+
+rm "$LOCAL_DIR/dir-a/dir-b/file-b-1"
+ci-storage \
+  --slot-id=myslot \
+  store
+ci-storage \
+  --slot-id=myslot \
+  --file-list=$file_list \
+  load
+
+test "$(grep -cF 'changed files per directory' "$OUT")" == 0
+grep -qF "Wrote the list of changed files to $file_list" "$OUT"
+test "$(gunzip -c $file_list | grep -c file-)" == 0
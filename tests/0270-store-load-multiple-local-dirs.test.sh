@@ -0,0 +1,46 @@
+#!/bin/bash
+source ./common.sh
+
+local_dir_2=$LOCAL_DIR-2
+mkdir -p $local_dir_2
+touch $local_dir_2/file-2
+slug_1=$(realpath -m "$LOCAL_DIR" | tr / _)
+slug_2=$(realpath -m "$local_dir_2" | tr / _)
+
+ci-storage \
+  --slot-id=myslot \
+  --local-dir=$local_dir_2 \
+  store
+
+test "$(grep -c '<LIST_SLOTS>' "$OUT")" == 1
+grep -qF "[$LOCAL_DIR] " "$OUT"
+grep -qF "[$local_dir_2] " "$OUT"
+test -f "$STORAGE_DIR/$slug_1/myslot/file-1"
+test -f "$STORAGE_DIR/$slug_2/myslot/file-2"
+test ! -e "$STORAGE_DIR/$slug_1/myslot/file-2"
+
+rm -rf "${LOCAL_DIR:?}"/* $local_dir_2/*
+ci-storage \
+  --slot-id=myslot \
+  --local-dir=$local_dir_2 \
+  --ready-file=/tmp/ci-storage/ready \
+  load
+
+test -f "$LOCAL_DIR/file-1"
+test -f "$LOCAL_DIR/dir-a/file-a-1"
+test -f "$local_dir_2/file-2"
+test -f /tmp/ci-storage/ready
+
+# If one of the directories fails to store, no slot is committed. We make the
+# transfer fail by occupying the temporary slot directory name with a file.
+touch "$LOCAL_DIR/file-new"
+tmp_hash=$(echo -n "$(hostname):$LOCAL_DIR:myslot2" | sha256sum | cut -c1-16)
+touch "$STORAGE_DIR/$slug_1/myslot2.tmp.$tmp_hash"
+ci-storage \
+  --slot-id=myslot2 \
+  --local-dir=$local_dir_2 \
+  store || error=$?
+test "$error" != 0
+grep -qF 'since storing of another directory failed' "$OUT"
+test ! -e "$STORAGE_DIR/$slug_1/myslot2"
+test ! -e "$STORAGE_DIR/$slug_2/myslot2"
@@ -0,0 +1,19 @@
+#!/bin/bash
+source ./common.sh
+
+ci_storage_bin="$(realpath ../ci-storage)"
+
+# Some other process (e.g. the background initial "load" with --local-dir passed
+# as an absolute path) is working with the local directory.
+flock "/tmp/.ci-storage.lock._tmp_ci-storage_local_dir" sleep 3 &
+sleep 1
+
+# The job-time "store" passes --local-dir=".", but it still waits.
+(
+  cd "$LOCAL_DIR"
+  "$ci_storage_bin" --local-dir=. --storage-dir="$STORAGE_DIR" --slot-id=myslot store
+) &>$OUT
+wait
+
+grep -qF 'Waiting for another ci-storage process working with . to finish' "$OUT"
+test -f "$STORAGE_DIR/myslot/file-1"
@@ -0,0 +1,25 @@
+#!/bin/bash
+source ./common.sh
+
+ci_storage_bin="$(realpath ../ci-storage)"
+
+ci-storage \
+  --slot-id=myslot \
+  store
+
+# The job loads the directory with --local-dir=".", like the GitHub action does.
+(
+  cd "$LOCAL_DIR"
+  "$ci_storage_bin" --local-dir=. --storage-dir="$STORAGE_DIR" --slot-id=myslot --hint=aaa load
+) &>$OUT
+
+# The interruption flush passes the absolute path of the same directory, but it
+# still sees the loaded digest and hints.
+ci-storage \
+  --slot-id=interrupted \
+  --deadline-sec=60 \
+  --urgent \
+  store
+
+grep -qF 'storing slot-id="interrupted" as an alias of slot-id="myslot"' "$OUT"
+grep -qE 'hints=aaa$' "$STORAGE_DIR/interrupted/.ci-storage.meta"
@@ -0,0 +1,71 @@
+#!/bin/bash
+source ./common.sh
+
+rsync_bin="$(command -v rsync)"
+fake-ssh
+stats_file=/tmp/.ci-storage.transport.fakehost
+rm -f "$stats_file"
+
+# A forced profile is used as is, and the remote rsync version is remembered.
+ci-storage \
+  --storage-host=fakehost \
+  --transport=wan \
+  --slot-id=myslot1 \
+  store
+
+grep -qF 'Using wan transport profile (forced with --transport)' "$OUT"
+grep -qF -- '--no-whole-file --compress' "$OUT"
+grep -qF 'aes128-gcm@openssh.com' "$OUT"
+grep -qE '^rsync_version=[0-9.]+$' "$stats_file"
+
+# In auto mode, the profile with the highest measured throughput wins.
+cat > "$stats_file" <<'STATS'
+rsync_version=3.2.7
+rsync_features=
+runs=0
+lan=1000000 1
+wan=5000000 1
+STATS
+touch "$LOCAL_DIR/file-new-1"
+ci-storage \
+  --storage-host=fakehost \
+  --slot-id=myslot2 \
+  store
+
+grep -qF 'Using wan transport profile (the highest measured throughput)' "$OUT"
+test "$(grep -c -- '--checksum-choice' "$OUT")" == 0
+
+# Once in a while, the other profile is re-measured, and the throughput of big
+# enough transfers is recorded.
+sed -i 's/^runs=0$/runs=9/' "$stats_file"
+head -c 11000000 /dev/urandom > "$LOCAL_DIR/file-big"
+ci-storage \
+  --storage-host=fakehost \
+  --slot-id=myslot3 \
+  store
+
+grep -qF 'Using lan transport profile (re-measuring)' "$OUT"
+grep -qF -- '--whole-file' "$OUT"
+grep -qE '^runs=10$' "$stats_file"
+grep -qE '^lan=[0-9]+ 2$' "$stats_file"
+grep -qE '^wan=5000000 1$' "$stats_file"
+
+# The local rsync version is parsed to decide on the options it supports.
+cat > /tmp/ci-storage/bin/rsync <<SH
+#!/bin/bash
+if [[ "\$1" == "--version" ]]; then
+  echo "rsync  version 3.0.9  protocol version 30"
+  exit
+fi
+exec "$rsync_bin" "\$@"
+SH
+chmod +x /tmp/ci-storage/bin/rsync
+touch "$LOCAL_DIR/file-new-2"
+ci-storage \
+  --slot-id=myslot4 \
+  store
+rm /tmp/ci-storage/bin/rsync
+
+grep -qF '3.0.9: too old; doesn'"'"'t support nanosecond precision' "$OUT"
+test "$(grep -c -- '--modify-window' "$OUT")" == 0
+test "$(grep -c -- '--info=progress2' "$OUT")" == 0
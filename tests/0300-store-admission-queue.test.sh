@@ -0,0 +1,40 @@
+#!/bin/bash
+source ./common.sh
+
+fake-ssh
+admission_dir="$STORAGE_DIR/.ci-storage.admission"
+
+# A waiter which died long ago doesn't block the queue.
+mkdir -p "$admission_dir"
+touch -d "2020-01-01" "$admission_dir/wait.0"
+
+# With max concurrency 1, the stores started later wait in the queue in the
+# order of their arrival, and all of them succeed eventually.
+for i in 1 2 3; do
+  mkdir -p "$LOCAL_DIR-$i"
+  head -c 200000 /dev/urandom > "$LOCAL_DIR-$i/file-$i"
+  (
+    ../ci-storage \
+      --storage-host=fakehost \
+      --storage-dir="$STORAGE_DIR" \
+      --storage-max-concurrency=1 \
+      --local-dir="$LOCAL_DIR-$i" \
+      --slot-id="myslot$i" \
+      --bwlimit=100 \
+      store &>"$OUT.$i"
+    echo "$i" >> "$OUT.order"
+  ) &
+  sleep 0.5
+done
+wait
+
+cat "$OUT".[123] > "$OUT"
+test ! -e "$admission_dir/wait.0"
+test "$(grep -c 'waiting in queue' "$OUT.1")" == 0
+grep -qF 'waiting in queue at position 1' "$OUT.2"
+grep -qF 'waiting in queue at position 2' "$OUT.3"
+grep -qF 'admitted after waiting' "$OUT.3"
+test "$(cat "$OUT.order" | tr -d '\n')" == "123"
+for i in 1 2 3; do
+  test -f "$STORAGE_DIR/myslot$i/file-$i"
+done
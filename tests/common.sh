@@ -20,7 +20,7 @@ export OUT=/tmp/ci-storage/out.txt
 export LOCAL_META_FILE=/tmp/.ci-storage.meta._tmp_ci-storage_local_dir
 export error=0
 
-rm -rf $STORAGE_DIR* $LOCAL_DIR* $OUT /tmp/.ci-storage.meta*
+rm -rf $STORAGE_DIR* $LOCAL_DIR* $OUT /tmp/ci-storage/bin /tmp/.ci-storage.meta* /tmp/.ci-storage.journal*
 mkdir -p $STORAGE_DIR $LOCAL_DIR
 touch $OUT
 
@@ -32,6 +32,20 @@ ci-storage() {
   ../ci-storage --local-dir="$LOCAL_DIR" --storage-dir="$STORAGE_DIR" "$@" &>$OUT
 }
 
+# Makes "ssh" run the commands locally, so the storage host passed with
+# --storage-host is "remote" while being the same machine.
+fake-ssh() {
+  mkdir -p /tmp/ci-storage/bin
+  cat >/tmp/ci-storage/bin/ssh <<'EOF'
+#!/bin/bash
+while [[ "$1" == -* ]]; do shift; done
+shift
+exec bash -c "$*"
+EOF
+  chmod +x /tmp/ci-storage/bin/ssh
+  export PATH="/tmp/ci-storage/bin:$PATH"
+}
+
 hardlink-count() {
   { set +o xtrace; } 2>/dev/null
   # shellcheck disable=SC2012